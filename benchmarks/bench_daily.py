@@ -0,0 +1,64 @@
+import argparse
+import collections
+import math
+import timeit
+
+from source.owm.decoder import forecast_decoder
+from source.owm.models import Forecast
+
+from .payloads import forecast_payload
+
+
+# What a caller would write without Forecast.get_daily: walk the Weather objects and bucket them by local date.
+def naive_daily(forecast: Forecast) -> list[tuple]:
+    buckets: dict = collections.OrderedDict()
+    for weather in forecast.weathers:
+        buckets.setdefault(weather.time.astimezone(forecast.timezone).date(), []).append(weather)
+    days = []
+    for date, weathers in buckets.items():
+        temperatures = [weather.main.temperature for weather in weathers if weather.main.temperature is not None]
+        days.append((
+            date, min(temperatures), max(temperatures), sum(temperatures) / len(temperatures),
+            max(weather.probability or 0 for weather in weathers),
+            sum(weather.rain.three_hour or 0 for weather in weathers),
+            sum(weather.snow.three_hour or 0 for weather in weathers),
+            collections.Counter(weather.conditions[0] for weather in weathers).most_common(1)[0][0]
+        ))
+    return days
+
+
+def _check(forecast: Forecast):
+    for expected, summary in zip(naive_daily(forecast), forecast.get_daily(), strict=True):
+        actual = (summary.date, summary.temperature_min, summary.temperature_max, summary.temperature_mean,
+                  summary.probability_max, summary.rain, summary.snow, summary.condition)
+        assert all(a == e or (isinstance(a, float) and math.isclose(a, e)) for a, e in zip(actual, expected)), \
+            (actual, expected)
+
+
+def _report(name: str, function, number: int, repeat: int) -> float:
+    best = min(timeit.repeat(function, number=number, repeat=repeat)) / number
+    print('{0:<32}{1:>10.2f} us/op'.format(name, best * 1e6))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare Forecast.get_daily with summarizing Weather objects.')
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    data = forecast_payload(lat=35.689, lon=139.692)
+    forecast = forecast_decoder().decode(data)
+    _check(forecast)
+    naive = _report('per request (objects)', lambda: naive_daily(forecast), args.number, args.repeat)
+    # A fresh Forecast each time so nothing is cached; construction is timed separately and subtracted.
+    build = _report('forecast construction', lambda: Forecast(weathers=forecast.weathers), args.number, args.repeat)
+    cold = _report('get_daily (first call)',
+                   lambda: Forecast(weathers=forecast.weathers).get_daily(), args.number, args.repeat) - build
+    cached = _report('get_daily (cached)', forecast.get_daily, args.number, args.repeat)
+    print('{0:<32}{1:>10.2f} us/op'.format('get_daily (first call) - build', cold * 1e6))
+    print('{0:<32}{1:>10.2f} x'.format('speedup (cached)', naive / cached))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import argparse
+import copy
+import datetime
+import timeit
+from typing import Union
+
+from source.owm.decoder import current_weather_decoder, current_weather_template, forecast_decoder, forecast_template
+from source.owm.models import Forecast, Weather, ZONE_TOKYO
+
+from .payloads import current_weather_payload, forecast_payload
+
+
+# The template merging and model construction OWM used before the compiled decoder, kept as the baseline.
+def _fix_dict(temp: dict, data: dict):
+    fixed: dict[Union[dict, list, str, float, int]] = {}
+    for key in temp:
+        if key in data:
+            if type(temp[key]) == dict and type(data[key]):
+                fixed[key] = _fix_dict(temp=temp[key], data=data[key])
+            elif type(temp[key]) == list and type(data[key]):
+                fixed[key] = _fix_list(temp=temp[key], data=data[key])
+            else:
+                fixed[key] = data[key]
+        else:
+            fixed[key] = temp[key]
+    return fixed
+
+
+def _fix_list(temp: list, data: list):
+    fixed = []
+    for datum in data:
+        if type(temp[0]) == dict and type(datum) == dict:
+            fixed.append(_fix_dict(temp=temp[0], data=datum))
+        elif type(temp[0]) == list and type(datum) == list:
+            fixed.append(_fix_list(temp=temp, data=datum))
+        else:
+            fixed.append(datum)
+    return fixed
+
+
+def legacy_current_weather(data: dict) -> Weather:
+    data = _fix_dict(temp=current_weather_template(), data=data)
+    return Weather(
+        city=Weather.City(
+            lat=data['coord']['lat'], lon=data['coord']['lon'],
+            name=data['name'], country=data['sys']['country'],
+            sunrise=datetime.datetime.fromtimestamp(data['sys']['sunrise'], tz=ZONE_TOKYO),
+            sunset=datetime.datetime.fromtimestamp(data['sys']['sunset'], tz=ZONE_TOKYO)
+        ),
+        conditions=[Weather.Condition(
+            id=_weather['id'], main=_weather['main'],
+            description=_weather['description'], icon=_weather['icon']) for _weather in data['weather']],
+        main=Weather.Main(
+            temperature=data['main']['temp'], feels_like=data['main']['feels_like'],
+            pressure=data['main']['pressure'], humidity=data['main']['humidity'],
+            temperature_max=data['main']['temp_max'], temperature_min=data['main']['temp_min'],
+            sea_level=data['main']['sea_level'], ground_level=data['main']['grnd_level']
+        ),
+        visibility=data['visibility'],
+        wind=Weather.Wind(speed=data['wind']['speed'], degrees=data['wind']['deg'], gust=data['wind']['gust']),
+        clouds=Weather.Clouds(cloudiness=data['clouds']['all']),
+        rain=Weather.Rain(an_hour=data['rain']['1h'], three_hour=data['rain']['3h']),
+        snow=Weather.Snow(an_hour=data['snow']['1h'], three_hour=data['snow']['3h']),
+        time=datetime.datetime.fromtimestamp(data['dt'], tz=ZONE_TOKYO),
+        timezone=datetime.timezone(offset=datetime.timedelta(seconds=data['timezone'])),
+        probability=None
+    )
+
+
+def legacy_forecast(data: dict) -> Forecast:
+    data = _fix_dict(temp=forecast_template(), data=data)
+    return Forecast(weathers=[Weather(
+        city=Weather.City(
+            lat=data['city']['coord']['lat'], lon=data['city']['coord']['lon'],
+            name=data['city']['name'], country=data['city']['country'],
+            sunrise=datetime.datetime.fromtimestamp(data['city']['sunrise'], tz=ZONE_TOKYO),
+            sunset=datetime.datetime.fromtimestamp(data['city']['sunset'], tz=ZONE_TOKYO)
+        ),
+        conditions=[Weather.Condition(
+            id=_weather['id'], main=_weather['main'],
+            description=_weather['description'], icon=_weather['icon']) for _weather in datum['weather']],
+        main=Weather.Main(
+            temperature=datum['main']['temp'], feels_like=datum['main']['feels_like'],
+            pressure=datum['main']['pressure'], humidity=datum['main']['humidity'],
+            temperature_max=datum['main']['temp_max'], temperature_min=datum['main']['temp_min'],
+            sea_level=datum['main']['sea_level'], ground_level=datum['main']['grnd_level']
+        ),
+        visibility=datum['visibility'],
+        wind=Weather.Wind(speed=datum['wind']['speed'], degrees=datum['wind']['deg'], gust=datum['wind']['gust']),
+        clouds=Weather.Clouds(cloudiness=datum['clouds']['all']),
+        rain=Weather.Rain(an_hour=None, three_hour=datum['rain']['3h']),
+        snow=Weather.Snow(an_hour=None, three_hour=datum['snow']['3h']),
+        time=datetime.datetime.fromtimestamp(datum['dt'], tz=ZONE_TOKYO),
+        timezone=datetime.timezone(offset=datetime.timedelta(seconds=data['city']['timezone'])),
+        probability=datum['pop']
+    ) for datum in data['list']])
+
+
+def _fields(weather: Weather) -> tuple:
+    # The legacy path never read the city id, so it is left out of the comparison.
+    return tuple(getattr(weather, name) for name in Weather.__slots__ if name != 'city') + (weather.city[:-1],)
+
+
+def _variants(data: dict, entry: dict) -> list[dict]:
+    # The payload as sent, and with each key of an entry missing in turn, which the template has to fill in.
+    variants = [data]
+    for key in list(entry):
+        variant = copy.deepcopy(data)
+        (variant['list'][0] if 'list' in variant else variant).pop(key)
+        variants.append(variant)
+    return variants
+
+
+def _check(legacy, compiled, data: dict, entry: dict):
+    for variant in _variants(data=data, entry=entry):
+        try:
+            expected = legacy(variant)
+        except TypeError:
+            # The template has null for some keys (sys.sunrise, dt, timezone), which the legacy path cannot decode.
+            continue
+        actual = compiled(variant)
+        if isinstance(expected, Forecast):
+            expected, actual = expected.weathers, actual.weathers
+        else:
+            expected, actual = [expected], [actual]
+        assert [_fields(weather) for weather in actual] == [_fields(weather) for weather in expected], \
+            (variant, actual, expected)
+
+
+def _report(name: str, function, number: int, repeat: int) -> float:
+    best = min(timeit.repeat(function, number=number, repeat=repeat)) / number
+    print('{0:<32}{1:>10.2f} us/op'.format(name, best * 1e6))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the compiled OWM decoder with the template merging path.')
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    current = current_weather_payload(lat=35.689, lon=139.692)
+    forecast = forecast_payload(lat=35.689, lon=139.692)
+    _check(legacy_current_weather, current_weather_decoder().decode, data=current, entry=current)
+    _check(legacy_forecast, forecast_decoder().decode, data=forecast, entry=forecast['list'][0])
+    legacy = _report('current weather (legacy)', lambda: legacy_current_weather(current), args.number, args.repeat)
+    compiled = _report('current weather (compiled)', lambda: current_weather_decoder().decode(current),
+                       args.number, args.repeat)
+    print('{0:<32}{1:>10.2f} x'.format('speedup', legacy / compiled))
+    legacy = _report('forecast (legacy)', lambda: legacy_forecast(forecast), args.number, args.repeat)
+    compiled = _report('forecast (compiled)', lambda: forecast_decoder().decode(forecast), args.number, args.repeat)
+    print('{0:<32}{1:>10.2f} x'.format('speedup', legacy / compiled))
+
+
+if __name__ == '__main__':
+    main()
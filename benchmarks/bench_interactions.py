@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import datetime
+import itertools
+import statistics
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Optional
+from unittest import mock
+
+import discord
+
+from source.main import Runner, Weather, WinID
+from source.owm.models import ZONE_TOKYO
+from source.owm.openweathermap import OWM
+from source.owm.ratelimit import RateLimiter
+from source.render import EmbedRenderer
+from source.storage import Subscription
+
+from .fake_owm import FakeOWMServer
+
+
+class MemoryStorage:
+    # Stands in for Storage with the same interface, so notice runs can be timed without Postgres.
+    def __init__(self, subscriptions: list[Subscription]):
+        self.rows = {subscription.id: subscription for subscription in subscriptions}
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def fetch_subscriptions(self) -> list[Subscription]:
+        return list(self.rows.values())
+
+    async def fetch_due_subscriptions(self, now: datetime.datetime) -> list[Subscription]:
+        return sorted((row for row in self.rows.values() if row.next_fire_at is not None and row.next_fire_at <= now),
+                      key=lambda row: row.next_fire_at)
+
+    async def update_many(self, updates: list[tuple[int, Optional[datetime.datetime], datetime.datetime]]):
+        for id, last, next_fire_at in updates:
+            row = self.rows[id]
+            self.rows[id] = row._replace(last=row.last if last is None else last, next_fire_at=next_fire_at)
+
+
+def _channel(id: int) -> mock.MagicMock:
+    channel = mock.MagicMock(spec=discord.TextChannel)
+    channel.id = id
+    channel.send = mock.AsyncMock()
+    return channel
+
+
+def _interaction(channel: mock.MagicMock, user_id: int) -> mock.MagicMock:
+    interaction = mock.MagicMock()
+    interaction.channel = channel
+    interaction.user.id = user_id
+    interaction.response.is_done.return_value = False
+    for name in ('edit_message', 'send_message', 'defer'):
+        setattr(interaction.response, name, mock.AsyncMock())
+    interaction.edit_original_response = mock.AsyncMock()
+    interaction.message.edit = mock.AsyncMock()
+    interaction.followup.send = mock.AsyncMock()
+    return interaction
+
+
+class Result:
+    def __init__(self, name: str, latencies: list[float], elapsed: float, peak_bytes: list[int], errors: int):
+        self.name = name
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+        self.peak_bytes = peak_bytes
+
+    def print(self):
+        p99 = self.latencies[max(0, int(len(self.latencies) * 0.99) - 1)]
+        print('{0:<36}{1:>9.1f} ops/s  p50 {2:>8.3f} ms  p99 {3:>8.3f} ms  peak {4:>7.1f} KiB/op  {5} errors'.format(
+            self.name, len(self.latencies) / self.elapsed, statistics.median(self.latencies) * 1e3, p99 * 1e3,
+            statistics.mean(self.peak_bytes) / 1024 if self.peak_bytes else 0.0, self.errors))
+
+
+async def _drive(name: str, operation: Callable[[int], Awaitable[None]], operations: int, concurrency: int,
+                 before: Callable[[], None]) -> Result:
+    latencies = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        for index in iter(lambda: next(counter), None):
+            if index >= operations:
+                return
+            before()
+            started = time.perf_counter()
+            try:
+                await operation(index)
+            except Exception:
+                # Injected upstream errors surface here; they still count towards latency.
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    # Allocations are traced in a separate serial pass so tracing does not distort the timings.
+    peak_bytes = []
+    tracemalloc.start()
+    for index in range(min(operations, 50)):
+        before()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        try:
+            await operation(index)
+        except Exception:
+            continue
+        peak_bytes.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return Result(name=name, latencies=latencies, elapsed=elapsed, peak_bytes=peak_bytes, errors=errors)
+
+
+async def run(args: argparse.Namespace):
+    server = FakeOWMServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=0)
+    base_url = await server.start()
+    # The fake server has no quota, so the limiter is opened up to measure the bot rather than the budget.
+    owm = OWM(api_key='benchmark', base_url=base_url, max_retries=args.retries,
+              limiter=RateLimiter(calls_per_minute=1e9, calls_per_day=1e12))
+    before = owm.cache.clear if args.cold else (lambda: None)
+    try:
+        channels = [_channel(id=index) for index in range(args.channels)]
+        renderer = EmbedRenderer()
+        runners = [Runner(channel=channel, owm=owm, renderer=renderer) for channel in channels]
+        interactions = [_interaction(channel=channel, user_id=index) for index, channel in enumerate(channels)]
+        buttons = [runner.window.get_view_items(index=WinID.MENU)[0] for runner in runners]
+
+        async def weather_button(index: int):
+            await buttons[index % len(buttons)].callback(interactions[index % len(interactions)])
+
+        async def forecast(index: int):
+            await runners[index % len(runners)].change_forecast_datetime(
+                interaction=interactions[index % len(interactions)], time=datetime.datetime.now(tz=ZONE_TOKYO))
+
+        bot = mock.MagicMock(spec=discord.ext.commands.Bot)
+        bot.get_channel.side_effect = lambda id: channels[id % len(channels)]
+        cog = Weather(bot=bot)
+        await cog.owm.close()
+        cog.owm = cog.dispatcher.owm = owm
+        cog.renderer = renderer
+        now = datetime.datetime.now(tz=ZONE_TOKYO)
+        subscriptions = [
+            Subscription(id=index, channel_id=index, time=now.time(), interval=datetime.timedelta(days=1), last=None,
+                         is_forecast=index % 2 == 1, lat=35.0 + index % args.locations, lon=139.0, next_fire_at=now)
+            for index in range(args.subscriptions)
+        ]
+        cog.storage = cog.dispatcher.storage = MemoryStorage(subscriptions=subscriptions)
+
+        async def notice(index: int):
+            await cog.notice_weather(subscriptions=subscriptions, now=now)
+
+        print('fake OWM at {0}, latency {1:.0f} ms + up to {2:.0f} ms, error rate {3:.1%}, cache {4}'.format(
+            base_url, args.latency * 1e3, args.jitter * 1e3, args.error_rate, 'cold' if args.cold else 'warm'))
+        results = [
+            await _drive('WeatherButton.callback', weather_button, args.operations, args.concurrency, before),
+            await _drive('Runner.change_forecast_datetime', forecast, args.operations, args.concurrency, before),
+            await _drive('notice_weather ({})'.format(args.subscriptions), notice,
+                         max(1, args.operations // 50), 1, before)
+        ]
+        for result in results:
+            result.print()
+        print('upstream requests: {0} ({1} errors), pool: {2}'.format(
+            server.requests, server.errors, owm.pool.stats.as_dict()))
+    finally:
+        await owm.close()
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive the bot hot paths against a local fake OpenWeatherMap.')
+    parser.add_argument('--operations', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--channels', type=int, default=50)
+    parser.add_argument('--subscriptions', type=int, default=200)
+    parser.add_argument('--locations', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--retries', type=int, default=0, help='OWM retries per call on upstream errors')
+    parser.add_argument('--cold', action='store_true', help='clear the response cache before every operation')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import datetime
+import os
+import statistics
+import time
+
+import psycopg2
+import psycopg2.extras
+
+from source.owm.models import ZONE_TOKYO
+from source.schema import migrate
+
+SCHEMA = 'weather_bench'
+LEGACY_DDL = 'CREATE TABLE weather_legacy (channel_id BIGINT, time TIME, interval INTERVAL, last TIMESTAMP, is_forecast BOOLEAN, lat REAL, lon REAL)'
+# Spreads subscriptions over every minute of the day, a few per channel, like real guilds do.
+SEED = '''
+INSERT INTO {table} (channel_id, time, interval, last, is_forecast, lat, lon{extra_columns})
+SELECT i / 3, make_time((i %% 1440) / 60, i %% 60, 0), INTERVAL '1 day', NULL, i %% 2 = 0,
+       35 + (i %% 100) / 100.0, 139 + (i %% 97) / 100.0{extra_values}
+FROM generate_series(1, %s) AS i
+'''
+NEXT_FIRE_AT = ", %s::TIMESTAMPTZ + make_interval(mins => i %% 1440)"
+
+
+def _measure(cur, repeat: int, statement: str, params_list: list) -> list[float]:
+    timings = []
+    for index in range(repeat):
+        started = time.perf_counter()
+        cur.execute(statement, params_list[index % len(params_list)])
+        if cur.description is not None:
+            cur.fetchall()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def _report(name: str, timings: list[float]):
+    timings = sorted(timings)
+    print('{0:<36}p50 {1:>9.3f} ms   p99 {2:>9.3f} ms'.format(
+        name, statistics.median(timings) * 1e3, timings[int(len(timings) * 0.99) - 1] * 1e3))
+
+
+def _plan(cur, statement: str, params) -> str:
+    cur.execute('EXPLAIN ' + statement, params)
+    return ' / '.join(row[0].strip() for row in cur.fetchall()[:2])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed subscriptions and time the due query and bulk update.')
+    parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=100)
+    args = parser.parse_args()
+
+    connection = psycopg2.connect(args.dsn)
+    connection.autocommit = True
+    today = datetime.datetime.now(tz=ZONE_TOKYO).replace(hour=0, minute=0, second=0, microsecond=0)
+    try:
+        with connection.cursor() as cur:
+            cur.execute('DROP SCHEMA IF EXISTS {0} CASCADE; CREATE SCHEMA {0}; SET search_path TO {0}'.format(SCHEMA))
+            connection.autocommit = False
+            migrate(connection)
+            cur.execute(SEED.format(table='weather', extra_columns=', next_fire_at', extra_values=NEXT_FIRE_AT),
+                        (today, args.rows))
+            cur.execute(LEGACY_DDL)
+            cur.execute(SEED.format(table='weather_legacy', extra_columns='', extra_values=''), (args.rows,))
+            cur.execute('ANALYZE weather; ANALYZE weather_legacy')
+            connection.commit()
+            print('seeded {} subscriptions'.format(args.rows))
+
+            minutes = [today + datetime.timedelta(minutes=minute) for minute in range(0, 1440, 7)]
+            due = 'SELECT id, channel_id, lat, lon FROM weather WHERE %s <= next_fire_at AND next_fire_at < %s'
+            due_params = [(minute, minute + datetime.timedelta(minutes=1)) for minute in minutes]
+            legacy_due = 'SELECT channel_id, interval, last, lat, lon FROM weather_legacy WHERE %s < time AND time < %s'
+            legacy_params = [((minute - datetime.timedelta(minutes=1)).time(),
+                              (minute + datetime.timedelta(minutes=1)).time()) for minute in minutes]
+            print('plan (indexed): ' + _plan(cur, due, due_params[0]))
+            print('plan (legacy):  ' + _plan(cur, legacy_due, legacy_params[0]))
+            _report('due query (next_fire_at index)', _measure(cur, args.repeat, due, due_params))
+            _report('due query (legacy time window)', _measure(cur, args.repeat, legacy_due, legacy_params))
+
+            ids = list(range(1, args.rows + 1, max(1, args.rows // args.batch)))[:args.batch]
+            now = datetime.datetime.now(tz=ZONE_TOKYO).replace(tzinfo=None)
+            timings = []
+            for _ in range(max(1, args.repeat // 10)):
+                started = time.perf_counter()
+                psycopg2.extras.execute_values(
+                    cur,
+                    'UPDATE weather SET last = v.last, next_fire_at = v.next_fire_at '
+                    'FROM (VALUES %s) AS v (id, last, next_fire_at) WHERE weather.id = v.id',
+                    [(id, now, today + datetime.timedelta(days=1)) for id in ids],
+                    template='(%s::BIGINT, %s::TIMESTAMP, %s::TIMESTAMPTZ)'
+                )
+                connection.commit()
+                timings.append(time.perf_counter() - started)
+            _report('bulk update of {} rows by id'.format(len(ids)), timings)
+            timings = []
+            for _ in range(max(1, args.repeat // 10)):
+                started = time.perf_counter()
+                for id in ids:
+                    cur.execute('UPDATE weather_legacy SET last = %s WHERE channel_id = %s', (now, id // 3))
+                connection.commit()
+                timings.append(time.perf_counter() - started)
+            _report('legacy per-channel updates of {}'.format(len(ids)), timings)
+    finally:
+        connection.rollback()
+        connection.autocommit = True
+        with connection.cursor() as cur:
+            cur.execute('DROP SCHEMA IF EXISTS {} CASCADE'.format(SCHEMA))
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
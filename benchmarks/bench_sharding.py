@@ -0,0 +1,185 @@
+import argparse
+import datetime
+import multiprocessing
+import os
+import statistics
+import time
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+
+from source.owm.models import ZONE_TOKYO
+from source.schema import migrate
+
+SCHEMA = 'weather_shard_bench'
+LOG_DDL = '''
+CREATE TABLE notice_expected (channel_id BIGINT PRIMARY KEY, fire_at TIMESTAMPTZ NOT NULL);
+CREATE TABLE notice_log (channel_id BIGINT NOT NULL, owner TEXT NOT NULL,
+                         sent_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp())
+'''
+
+
+class _Channel:
+    # Records every notice the cog sends, in place of a Discord channel.
+    def __init__(self, id: int, log: psycopg2.extensions.connection, owner: str, latency: float):
+        self.id = id
+        self.log = log
+        self.owner = owner
+        self.latency = latency
+
+    async def send(self, **kwargs):
+        import asyncio
+        await asyncio.sleep(self.latency)
+        with self.log.cursor() as cur:
+            cur.execute('INSERT INTO notice_log (channel_id, owner) VALUES (%s, %s)', (self.id, self.owner))
+
+
+async def _work(until: float, lease: float, poll: float, takeover: float, send_latency: float):
+    # Imported here so the settings the parent put in the environment are read by this process.
+    import asyncio
+    from unittest import mock
+
+    import discord
+
+    from source.dispatch import INSTANCE_ID
+    from source.main import Weather
+    from source.owm.openweathermap import OWM
+    from source.owm.ratelimit import RateLimiter
+
+    from .fake_owm import FakeOWMServer
+
+    server = FakeOWMServer(seed=0)
+    # The fake server has no quota, so the limiter is opened up to measure the handover rather than the budget.
+    owm = OWM(api_key='benchmark', base_url=await server.start(),
+              limiter=RateLimiter(calls_per_minute=1e9, calls_per_day=1e12))
+    log = psycopg2.connect(os.environ['DATABASE_URL'])
+    log.autocommit = True
+    bot = mock.MagicMock(spec=discord.ext.commands.Bot)
+    bot.get_channel.side_effect = lambda id: _Channel(id=id, log=log, owner=INSTANCE_ID, latency=send_latency)
+    cog = Weather(bot=bot)
+    await cog.owm.close()
+    cog.owm = cog.dispatcher.owm = cog.prefetcher.owm = owm
+    cog.scheduler.poll_interval = poll
+    cog.dispatcher.lease = datetime.timedelta(seconds=lease)
+    cog.dispatcher.takeover = datetime.timedelta(seconds=takeover)
+    # The same start-up a bot process goes through, including loading and backfilling the table.
+    await cog.cog_load()
+    try:
+        await asyncio.sleep(until - time.time())
+    finally:
+        await cog.cog_unload()
+        await server.stop()
+        log.close()
+    print('{0}: {1} OWM requests'.format(INSTANCE_ID, server.requests))
+
+
+def _worker(until: float, lease: float, poll: float, takeover: float, send_latency: float):
+    import asyncio
+    asyncio.run(_work(until=until, lease=lease, poll=poll, takeover=takeover, send_latency=send_latency))
+
+
+def _seed(cur, rows: int, locations: int, start: datetime.datetime, spread: float):
+    fires = [start + datetime.timedelta(seconds=spread * index / rows) for index in range(rows)]
+    psycopg2.extras.execute_values(
+        cur,
+        'INSERT INTO weather (channel_id, time, interval, last, is_forecast, lat, lon, next_fire_at) VALUES %s',
+        [(index, fire.timetz().replace(tzinfo=None), datetime.timedelta(days=1), None, index % 2 == 1,
+          35.0 + index % locations * 0.1, 139.0, fire) for index, fire in enumerate(fires)],
+        page_size=1000)
+    psycopg2.extras.execute_values(cur, 'INSERT INTO notice_expected (channel_id, fire_at) VALUES %s',
+                                   list(enumerate(fires)), page_size=1000)
+
+
+def _report(cur):
+    cur.execute('SELECT count(*) FROM notice_expected e LEFT JOIN notice_log l ON l.channel_id = e.channel_id '
+                'WHERE l.channel_id IS NULL')
+    lost = cur.fetchone()[0]
+    cur.execute('SELECT count(*) FROM (SELECT channel_id FROM notice_log GROUP BY channel_id '
+                'HAVING count(*) > 1) AS duplicated')
+    duplicated = cur.fetchone()[0]
+    cur.execute('SELECT owner, count(*) FROM notice_log GROUP BY owner ORDER BY owner')
+    owners = cur.fetchall()
+    cur.execute('SELECT extract(epoch FROM l.sent_at - e.fire_at) FROM notice_log l '
+                'JOIN notice_expected e ON e.channel_id = l.channel_id ORDER BY 1')
+    delays = [float(row[0]) for row in cur.fetchall()]
+    print('sent by: {}'.format(', '.join('{0} {1}'.format(owner, count) for owner, count in owners)))
+    print('lost {0}, sent more than once {1}'.format(lost, duplicated))
+    if delays:
+        print('delay after fire time: p50 {0:.3f} s  p99 {1:.3f} s  max {2:.3f} s'.format(
+            statistics.median(delays), delays[max(0, int(len(delays) * 0.99) - 1)], delays[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run several bot processes against one Postgres, kill and restart one, and check every notice '
+                    'went out once.')
+    parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--processes', type=int, default=3)
+    parser.add_argument('--rows', type=int, default=600)
+    parser.add_argument('--locations', type=int, default=30)
+    parser.add_argument('--spread', type=float, default=8.0, help='seconds over which the notices fall due')
+    parser.add_argument('--lease', type=float, default=3.0)
+    parser.add_argument('--poll', type=float, default=0.5)
+    parser.add_argument('--takeover', type=float, default=1.0,
+                        help='seconds late before a row is claimed outside its partition')
+    parser.add_argument('--no-partitions', action='store_true',
+                        help='let every process claim any row, to compare the OWM requests')
+    parser.add_argument('--send-latency', type=float, default=0.02)
+    parser.add_argument('--kill-after', type=float, default=4.0, help='seconds until the first process is killed')
+    parser.add_argument('--restart-after', type=float, default=0.5,
+                        help='seconds after the kill until it is started again under the same instance id')
+    args = parser.parse_args()
+
+    connection = psycopg2.connect(args.dsn)
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cur:
+            cur.execute('DROP SCHEMA IF EXISTS {0} CASCADE; CREATE SCHEMA {0}; SET search_path TO {0}'.format(SCHEMA))
+            connection.autocommit = False
+            migrate(connection)
+            cur.execute(LOG_DDL)
+            start = datetime.datetime.now(tz=ZONE_TOKYO) + datetime.timedelta(seconds=3)
+            _seed(cur, rows=args.rows, locations=args.locations, start=start, spread=args.spread)
+            connection.commit()
+            connection.autocommit = True
+
+            # Spawned processes start from this environment, so each runs as its own sharded bot instance.
+            os.environ.update({
+                'DATABASE_URL': psycopg2.extensions.make_dsn(args.dsn, options='-c search_path={}'.format(SCHEMA)),
+                'WEATHER_SHARDED': '1', 'OWM_SNAPSHOT_PATH': '',
+                'WEATHER_PROCESSES': '1' if args.no_partitions else str(args.processes)
+            })
+            until = time.time() + 3 + args.spread + args.lease + 2 * args.poll + 3
+            context = multiprocessing.get_context('spawn')
+
+            def spawn(index: int) -> multiprocessing.Process:
+                os.environ['WEATHER_INSTANCE_ID'] = 'process-{}'.format(index)
+                os.environ['WEATHER_PROCESS_INDEX'] = '0' if args.no_partitions else str(index)
+                process = context.Process(target=_worker,
+                                          args=(until, args.lease, args.poll, args.takeover, args.send_latency))
+                process.start()
+                return process
+
+            processes = [spawn(index=index) for index in range(args.processes)]
+            time.sleep(args.kill_after)
+            processes[0].kill()
+            processes[0].join()
+            time.sleep(args.restart_after)
+            processes.append(spawn(index=0))
+            print('{0} processes, {1} notices over {2:.0f} s, process-0 killed after {3:.0f} s and restarted {4:.1f} s '
+                  'later, lease {5:.0f} s'.format(args.processes, args.rows, args.spread, args.kill_after,
+                                                  args.restart_after, args.lease))
+            for process in processes:
+                process.join()
+            _report(cur)
+    finally:
+        connection.rollback()
+        connection.autocommit = True
+        with connection.cursor() as cur:
+            cur.execute('DROP SCHEMA IF EXISTS {} CASCADE'.format(SCHEMA))
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from source.owm.openweathermap import OWM
+from source.owm.ratelimit import RateLimiter
+from source.owm.snapshot import SnapshotStore
+
+from .fake_owm import FakeOWMServer
+
+
+async def _first_responses(base_url: str, path: str, locations: list[tuple[float, float]]) -> tuple[list[float], int]:
+    # A fresh OWM per run stands in for a restarted process: empty memory cache, same snapshot file.
+    owm = OWM(api_key='benchmark', base_url=base_url, snapshots=SnapshotStore(path=path) if path else None,
+              limiter=RateLimiter(calls_per_minute=1e9, calls_per_day=1e12))
+    latencies = []
+    try:
+        for lat, lon in locations:
+            started = time.perf_counter()
+            await owm.get_current_weather(lat=lat, lon=lon)
+            await owm.get_forecast(lat=lat, lon=lon)
+            latencies.append(time.perf_counter() - started)
+    finally:
+        await owm.close()
+    return latencies, owm.pool.stats.requests
+
+
+def _print(name: str, latencies: list[float], requests: int):
+    print('{0:<28}first {1:>8.2f} ms  median {2:>8.2f} ms  total {3:>9.1f} ms  {4} upstream requests'.format(
+        name, latencies[0] * 1e3, statistics.median(latencies) * 1e3, sum(latencies) * 1e3, requests))
+
+
+async def run(args: argparse.Namespace):
+    server = FakeOWMServer(latency=args.latency, jitter=args.jitter, seed=0)
+    base_url = await server.start()
+    locations = [(35.0 + index * 0.1, 139.0 + index * 0.1) for index in range(args.locations)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'snapshots.sqlite3')
+        try:
+            print('fake OWM at {0}, latency {1:.0f} ms + up to {2:.0f} ms, {3} locations'.format(
+                base_url, args.latency * 1e3, args.jitter * 1e3, args.locations))
+            _print('no snapshot store', *await _first_responses(base_url=base_url, path='', locations=locations))
+            _print('cold start (empty store)', *await _first_responses(base_url=base_url, path=path, locations=locations))
+            _print('warm start', *await _first_responses(base_url=base_url, path=path, locations=locations))
+            print('snapshot file: {0:.1f} KiB'.format(os.path.getsize(path) / 1024))
+        finally:
+            await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time to first response after a restart, with and without snapshots.')
+    parser.add_argument('--locations', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--jitter', type=float, default=0.05)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import random
+from typing import Optional
+
+from aiohttp import web
+
+from .payloads import current_weather_payload, forecast_payload, group_payload
+
+
+def city_id(lat: float, lon: float) -> int:
+    # Every 0.01 degree cell is its own city, and the id encodes the cell so /group needs no lookup table.
+    return round((lat + 90) * 100) * 100000 + round((lon + 180) * 100)
+
+
+def city_location(id: int) -> tuple[float, float]:
+    return id // 100000 / 100 - 90, id % 100000 / 100 - 180
+
+
+class FakeOWMServer:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.app = web.Application()
+        self.app.add_routes([
+            web.get('/data/2.5/weather', self.weather),
+            web.get('/data/2.5/forecast', self.forecast),
+            web.get('/data/2.5/group', self.group)
+        ])
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url: Optional[str] = None
+
+    async def _respond(self, request: web.Request, build) -> web.Response:
+        self.requests += 1
+        delay = self.latency + self.random.uniform(0.0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({'cod': 500, 'message': 'injected error'}, status=500)
+        try:
+            return web.json_response(build(request.query))
+        except (KeyError, ValueError):
+            return web.json_response({'cod': '400', 'message': 'bad request'}, status=400)
+
+    @staticmethod
+    def _location(query) -> dict:
+        lat = float(query['lat'])
+        lon = float(query['lon'])
+        return {'lat': lat, 'lon': lon, 'city_id': city_id(lat=lat, lon=lon)}
+
+    async def weather(self, request: web.Request) -> web.Response:
+        return await self._respond(request=request, build=lambda query: current_weather_payload(**self._location(query)))
+
+    async def forecast(self, request: web.Request) -> web.Response:
+        return await self._respond(request=request, build=lambda query: forecast_payload(**self._location(query)))
+
+    async def group(self, request: web.Request) -> web.Response:
+        def build(query) -> dict:
+            ids = [int(id) for id in query['id'].split(',')]
+            if len(ids) > 20:
+                raise ValueError(len(ids))
+            return group_payload(locations=[(id,) + city_location(id=id) for id in ids])
+        return await self._respond(request=request, build=build)
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host=host, port=port)
+        await site.start()
+        host, port = site._server.sockets[0].getsockname()[:2]
+        self.base_url = 'http://{0}:{1}'.format(host, port)
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve OpenWeatherMap-shaped responses built from the bundled templates.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.02, help='extra random seconds, uniform in [0, jitter]')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with HTTP 500')
+    args = parser.parse_args()
+    server = FakeOWMServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    web.run_app(server.app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import copy
+import random
+import time
+from typing import Final, Optional
+
+from source.owm.decoder import current_weather_template, forecast_template
+
+FORECAST_COUNT: Final[int] = 40
+FORECAST_STEP: Final[int] = 3 * 60 * 60
+CONDITIONS: Final[tuple[tuple[int, str, str, str], ...]] = (
+    (800, 'Clear', '晴天', '01d'),
+    (802, 'Clouds', '雲', '03d'),
+    (500, 'Rain', '小雨', '10d'),
+    (600, 'Snow', '雪', '13d')
+)
+
+
+def _fill_entry(entry: dict, dt: int, rng: random.Random):
+    condition = rng.choice(CONDITIONS)
+    temperature = round(rng.uniform(-5.0, 35.0), 2)
+    entry['dt'] = dt
+    entry['main'].update({
+        'temp': temperature, 'feels_like': temperature - 1.0, 'temp_min': temperature - 2.0,
+        'temp_max': temperature + 2.0, 'pressure': rng.randint(990, 1030), 'humidity': rng.randint(20, 100),
+        'sea_level': 1013, 'grnd_level': 1008
+    })
+    entry['weather'] = [dict(zip(('id', 'main', 'description', 'icon'), condition))]
+    entry['clouds']['all'] = rng.randint(0, 100)
+    entry['wind'].update({'speed': round(rng.uniform(0.0, 15.0), 2), 'deg': rng.randint(0, 359),
+                          'gust': round(rng.uniform(0.0, 20.0), 2)})
+    entry['visibility'] = 10000
+    entry['rain']['3h'] = round(rng.uniform(0.0, 5.0), 2) if condition[1] == 'Rain' else 0.0
+    entry['snow']['3h'] = round(rng.uniform(0.0, 5.0), 2) if condition[1] == 'Snow' else 0.0
+
+
+def group_payload(locations: list[tuple[int, float, float]], now: Optional[int] = None, seed: int = 0) -> dict:
+    # /data/2.5/group: current weather entries for (city id, lat, lon), timezone moved under sys.
+    entries = []
+    for city_id, lat, lon in locations:
+        entry = current_weather_payload(lat=lat, lon=lon, now=now, seed=seed, city_id=city_id)
+        entry['sys']['timezone'] = entry.pop('timezone')
+        for key in ('base', 'cod'):
+            entry.pop(key)
+        entries.append(entry)
+    return {'cnt': len(entries), 'list': entries}
+
+
+def current_weather_payload(lat: float, lon: float, now: Optional[int] = None, seed: int = 0,
+                            city_id: int = 1850144) -> dict:
+    rng = random.Random(seed)
+    now = int(time.time()) if now is None else now
+    data = copy.deepcopy(current_weather_template())
+    _fill_entry(entry=data, dt=now, rng=rng)
+    data['rain']['1h'] = data['rain']['3h'] / 3
+    data['snow']['1h'] = data['snow']['3h'] / 3
+    data['coord'] = {'lat': lat, 'lon': lon}
+    data['sys'].update({'country': 'JP', 'sunrise': now - 6 * 60 * 60, 'sunset': now + 6 * 60 * 60})
+    data.update({'timezone': 9 * 60 * 60, 'name': '東京都', 'cod': 200, 'base': 'stations', 'id': city_id})
+    return data
+
+
+def forecast_payload(lat: float, lon: float, now: Optional[int] = None, count: int = FORECAST_COUNT,
+                     seed: int = 0, city_id: int = 1850144) -> dict:
+    rng = random.Random(seed)
+    now = int(time.time()) if now is None else now
+    start = now - now % FORECAST_STEP + FORECAST_STEP
+    data = copy.deepcopy(forecast_template())
+    entry_template = data['list'][0]
+    data['list'] = []
+    for index in range(count):
+        entry = copy.deepcopy(entry_template)
+        _fill_entry(entry=entry, dt=start + index * FORECAST_STEP, rng=rng)
+        entry['pop'] = round(rng.random(), 2)
+        entry['sys']['pod'] = 'd'
+        data['list'].append(entry)
+    data.update({'cod': '200', 'message': 0, 'cnt': count})
+    data['city'].update({
+        'id': city_id, 'name': '東京都', 'coord': {'lat': lat, 'lon': lon}, 'country': 'JP',
+        'population': 12445327, 'timezone': 9 * 60 * 60,
+        'sunrise': now - 6 * 60 * 60, 'sunset': now + 6 * 60 * 60
+    })
+    return data
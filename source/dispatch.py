@@ -0,0 +1,180 @@
+import asyncio
+import datetime
+import decimal
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Final, NamedTuple, Optional, Union
+
+from .owm.cache import quantize
+from .owm.openweathermap import OWM, Forecast, Weather
+from .owm.ratelimit import Priority
+from .scheduler import delivered, retry_fire_at
+from .storage import Storage, Subscription
+
+DEFAULT_CONCURRENCY: Final[int] = 5
+# Set on every process of a sharded deployment: notices are then leased row by row from Postgres, so each goes out
+# from one process, and rows leased by a process that dies are picked up by the others once the lease runs out.
+SHARDED: Final[bool] = os.getenv('WEATHER_SHARDED', '') not in ('', '0')
+INSTANCE_ID: Final[str] = os.getenv('WEATHER_INSTANCE_ID') or '{0}:{1}'.format(socket.gethostname(), os.getpid())
+# How many processes share the table and the OWM key, and which of them this is (0 to WEATHER_PROCESSES - 1). Each
+# process splits the OWM budget by the count and prefers the locations of its own partition.
+PROCESSES: Final[int] = int(os.getenv('WEATHER_PROCESSES', '1'))
+PROCESS_INDEX: Final[int] = int(os.getenv('WEATHER_PROCESS_INDEX', '0'))
+DEFAULT_LEASE: Final[datetime.timedelta] = datetime.timedelta(minutes=5)
+DEFAULT_CLAIM_LIMIT: Final[int] = 1000
+# Rows of another partition are claimed once they are this late, so a dead or overloaded process holds nothing up
+# for long.
+DEFAULT_TAKEOVER: Final[datetime.timedelta] = datetime.timedelta(seconds=30)
+
+logger = logging.getLogger(__name__)
+
+
+def _hundredths(value: float) -> int:
+    # round(value::NUMERIC, 2) * 100 on a REAL column: Postgres converts through 6 significant digits and rounds
+    # halves away from zero, where round() would work on the binary value and round halves to even.
+    rounded = decimal.Decimal('%.6g' % value).quantize(decimal.Decimal('0.01'), rounding=decimal.ROUND_HALF_UP)
+    return int(rounded * 100)
+
+
+def partition_of(lat: float, lon: float, partitions: int) -> int:
+    # The grid cell of the location, computed as the claim_due_subscriptions statement does, so every subscription
+    # at one location is fetched and sent by the same process, and the process warming it is the one claiming it.
+    return ((_hundredths(lat) + 9000) * 36001 + _hundredths(lon) + 18000) % partitions
+
+
+class DispatchReport(NamedTuple):
+    subscriptions: int
+    locations: int
+    sent: int
+    failed: int
+    fetch_seconds: float
+    send_seconds: float
+    update_seconds: float
+    # Ids of the subscriptions that were not sent and are due again shortly.
+    undelivered: frozenset[int] = frozenset()
+
+    @property
+    def total_seconds(self) -> float:
+        return self.fetch_seconds + self.send_seconds + self.update_seconds
+
+
+class NoticeDispatcher:
+    def __init__(self, owm: OWM, storage: Storage,
+                 send_weather: Callable[[Subscription, Weather], Awaitable[None]],
+                 send_forecast: Callable[[Subscription, Forecast], Awaitable[None]],
+                 concurrency: int = DEFAULT_CONCURRENCY, owner: Optional[str] = None,
+                 lease: datetime.timedelta = DEFAULT_LEASE, claim_limit: int = DEFAULT_CLAIM_LIMIT,
+                 partitions: int = 1, partition: int = 0, takeover: datetime.timedelta = DEFAULT_TAKEOVER):
+        self.owm = owm
+        self.storage = storage
+        self.send_weather = send_weather
+        self.send_forecast = send_forecast
+        # Bounds the sends in flight so a large run stays inside Discord's global rate limit.
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # None sends whatever the local scheduler hands over; otherwise only rows leased under this owner.
+        self.owner = owner
+        self.lease = lease
+        self.claim_limit = claim_limit
+        self.partitions = partitions
+        self.partition = partition
+        self.takeover = takeover
+
+    def prefers(self, subscription: Subscription) -> bool:
+        # Whether this process claims the subscription when it falls due, rather than only when it is left over.
+        return partition_of(lat=subscription.lat, lon=subscription.lon, partitions=self.partitions) == self.partition
+
+    async def _renew(self, ids: list[int]):
+        # Keeps the claimed rows leased while a run held up by rate limits or Discord outlasts the lease.
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            try:
+                await self.storage.renew_leases(owner=self.owner, lease=self.lease, ids=ids)
+            except Exception:
+                logger.exception('renewing the leases on %d subscriptions failed', len(ids))
+
+    async def _send(self, subscription: Subscription, data: Union[Weather, Forecast]) -> bool:
+        async with self.semaphore:
+            try:
+                if subscription.is_forecast:
+                    await self.send_forecast(subscription, data)
+                else:
+                    await self.send_weather(subscription, data)
+                return True
+            except Exception:
+                logger.exception('failed to send a notice to channel %s', subscription.channel_id)
+                return False
+
+    async def dispatch(self, subscriptions: list[Subscription], now: datetime.datetime) -> DispatchReport:
+        if self.owner is not None:
+            # The local heap only says when to look; rows left over past claim_limit go in the next poll.
+            subscriptions = await self.storage.claim_due_subscriptions(
+                owner=self.owner, now=now, lease=self.lease, limit=self.claim_limit, partitions=self.partitions,
+                partition=self.partition, takeover=self.takeover)
+            if not subscriptions:
+                return DispatchReport(subscriptions=0, locations=0, sent=0, failed=0,
+                                      fetch_seconds=0.0, send_seconds=0.0, update_seconds=0.0)
+        groups: dict[tuple[bool, float, float], list[Subscription]] = {}
+        for subscription in subscriptions:
+            key = (subscription.is_forecast,) + quantize(lat=subscription.lat, lon=subscription.lon)
+            groups.setdefault(key, []).append(subscription)
+
+        renewal = None
+        if self.owner is not None:
+            renewal = asyncio.create_task(self._renew(ids=[subscription.id for subscription in subscriptions]))
+        try:
+            started = time.perf_counter()
+            # One batch per endpoint, so current weather for many cities can share /group requests.
+            weathers, forecasts = await asyncio.gather(
+                self.owm.get_current_weather_many(locations=[key[1:] for key in groups if not key[0]],
+                                                  priority=Priority.BACKGROUND),
+                self.owm.get_forecast_many(locations=[key[1:] for key in groups if key[0]],
+                                           priority=Priority.BACKGROUND)
+            )
+            fetched = time.perf_counter()
+
+            sends = []
+            failed = 0
+            for key, group in groups.items():
+                result = (forecasts if key[0] else weathers).get(key[1:])
+                if result is None:
+                    # Already logged by OWM.
+                    failed += len(group)
+                    continue
+                sends.extend((subscription, self._send(subscription=subscription, data=result))
+                             for subscription in group)
+            outcomes = await asyncio.gather(*[send for _, send in sends])
+            sent = time.perf_counter()
+        finally:
+            if renewal is not None:
+                renewal.cancel()
+
+        sent_ids = {subscription.id for (subscription, _), ok in zip(sends, outcomes) if ok}
+        # Delivered rows record a new 'last' and move on to their next slot; the rest keep 'last' and are retried
+        # after a backoff, so an OWM or Discord outage at the notice time does not skip the day.
+        if subscriptions:
+            updates = []
+            for subscription in subscriptions:
+                if subscription.id in sent_ids:
+                    done = delivered(subscription=subscription, now=now)
+                    updates.append((subscription.id, done.last, done.next_fire_at))
+                else:
+                    updates.append((subscription.id, None, retry_fire_at(subscription=subscription, now=now)))
+            if self.owner is None:
+                await self.storage.update_many(updates=updates)
+            else:
+                await self.storage.complete_many(owner=self.owner, updates=updates)
+        updated = time.perf_counter()
+
+        report = DispatchReport(
+            subscriptions=len(subscriptions), locations=len(groups), sent=len(sent_ids),
+            failed=failed + len(sends) - len(sent_ids), fetch_seconds=fetched - started,
+            send_seconds=sent - fetched, update_seconds=updated - sent,
+            undelivered=frozenset(subscription.id for subscription in subscriptions
+                                  if subscription.id not in sent_ids)
+        )
+        logger.info('notice run: %d subscriptions at %d locations, %d sent, %d failed '
+                    '(fetch %.3fs, send %.3fs, update %.3fs)', report.subscriptions, report.locations, report.sent,
+                    report.failed, report.fetch_seconds, report.send_seconds, report.update_seconds)
+        return report
@@ -1,19 +1,39 @@
+import asyncio
 import datetime
 import enum
-import os
+import logging
 import zoneinfo
+from typing import Callable, Final, Optional
 
 import discord
-import psycopg2
-import psycopg2.extras
-from discord.ext import commands, tasks
+from discord.ext import commands
 
 from .UtilityClasses_DiscordBot import base
-from .owm.openweathermap import OWM
+from .dispatch import INSTANCE_ID, PROCESS_INDEX, PROCESSES, SHARDED, NoticeDispatcher
+from .metrics import METRICS
+from .owm.cache import CURRENT_WEATHER, FORECAST
+from .owm.openweathermap import OWM, UPSTREAM_ERRORS, Forecast, Weather as WeatherData
+from .owm.prefetch import Prefetcher, subscription_target
+from .owm.ratelimit import RateLimiter
+from .owm.snapshot import SNAPSHOT_PATH, SnapshotStore
+from .registry import RunnerRegistry
+from .render import EmbedRenderer
+from .scheduler import DEFAULT_INTERVAL, NoticeScheduler, next_fire_at
+from .storage import Storage, Subscription
 
-DATABASE_URL = os.getenv('DATABASE_URL')
 ZONE_TOKYO = zoneinfo.ZoneInfo('Asia/Tokyo')
-DEFAULT_TIMES = [datetime.time(hour=0, minute=5)]
+# Shown until users can pick their own places.
+DEFAULT_LAT: Final[float] = 35.689
+DEFAULT_LON: Final[float] = 139.692
+# How often a sharded process looks for due rows it has not scheduled itself.
+NOTICE_POLL_INTERVAL: Final[float] = 15.0
+# Bounds of the back-off between attempts to bring up storage while Postgres is unreachable.
+BOOTSTRAP_RETRY_MIN: Final[float] = 1.0
+BOOTSTRAP_RETRY_MAX: Final[float] = 60.0
+DEFAULT_TARGETS: Final[tuple[tuple[str, float, float], ...]] = (
+    (CURRENT_WEATHER, DEFAULT_LAT, DEFAULT_LON), (FORECAST, DEFAULT_LAT, DEFAULT_LON))
+
+logger = logging.getLogger(__name__)
 
 
 class WinID(enum.IntEnum):
@@ -24,6 +44,7 @@ class WinID(enum.IntEnum):
     FORECAST_SETTING = 4
     WEATHER_NOTICE_SETTING = 5
     FORECAST_NOTICE_SETTING = 6
+    DAILY = 7
 
 
 class Button(discord.ui.Button):
@@ -34,7 +55,10 @@ class Button(discord.ui.Button):
         self.window = window
 
     async def callback(self, interaction: discord.Interaction):
-        await self.window.response_edit(interaction=interaction, index=self.index)
+        with METRICS.trace('button:{}'.format(self.index.name)), METRICS.timer('interaction', component='button'):
+            self.window.runner.touch(interaction=interaction)
+            with METRICS.timer('discord_edit'):
+                await self.window.response_edit(interaction=interaction, index=self.index)
 
 
 class WeatherButton(discord.ui.Button):
@@ -44,22 +68,17 @@ class WeatherButton(discord.ui.Button):
         self.runner = runner
 
     async def callback(self, interaction: discord.Interaction):
-        weather = await self.runner.owm.get_current_weather(lat=35.689, lon=139.692)
-        embed_dict = self.window.get_embed_dict(index=WinID.WEATHER)
-        embed_dict['title'] = '{}'.format(weather.city.name)
-        embed_dict['description'] = '現在{0}時点でのお天気は{1}です。'.format(
-                weather.time.strftime('%H時%M分'), weather.conditions[0].description
-            )
-        embed_dict['thumbnail'] = {'url': weather.get_icon_url()}
-        embed_dict['fields'] = [
-            {'name': '気温', 'value': '{}°C'.format(weather.main.temperature), 'inline': True},
-            {'name': '最高気温', 'value': '{}°C'.format(weather.main.temperature_max), 'inline': True},
-            {'name': '最低気温', 'value': '{}°C'.format(weather.main.temperature_min), 'inline': True},
-            {'name': '湿度', 'value': '{}%'.format(weather.main.humidity), 'inline': True},
-            {'name': '気圧', 'value': '{}hPa'.format(weather.main.pressure), 'inline': True}
-        ]
-        embed_dict['footer'] = {'text': 'OpenWeatherを参照しています。', 'url': OWM.OPEN_WEATHER_ICON_URL}
-        await self.window.response_edit(interaction=interaction, index=WinID.WEATHER)
+        with METRICS.trace('weather_button'), METRICS.timer('interaction', component='weather_button'):
+            self.runner.touch(interaction=interaction)
+            try:
+                weather = await self.runner.owm.get_current_weather(lat=DEFAULT_LAT, lon=DEFAULT_LON)
+            except UPSTREAM_ERRORS:
+                await self.runner.answer_unavailable(interaction=interaction)
+                return
+            self.window.get_embed_dict(index=WinID.WEATHER).update(
+                self.runner.renderer.weather(lat=DEFAULT_LAT, lon=DEFAULT_LON, weather=weather))
+            with METRICS.timer('discord_edit'):
+                await self.window.response_edit(interaction=interaction, index=WinID.WEATHER)
 
 
 class ForecastButton(discord.ui.Button):
@@ -68,19 +87,30 @@ class ForecastButton(discord.ui.Button):
         self.runner = runner
 
     async def callback(self, interaction: discord.Interaction):
-        await self.runner.change_forecast_datetime(interaction=interaction)
+        with METRICS.trace('forecast_button'), METRICS.timer('interaction', component='forecast_button'):
+            await self.runner.change_forecast_datetime(interaction=interaction)
+
+
+class DailyButton(discord.ui.Button):
+    def __init__(self, runner: 'Runner'):
+        super().__init__(label='日ごとの予報', style=discord.ButtonStyle.primary)
+        self.runner = runner
+
+    async def callback(self, interaction: discord.Interaction):
+        with METRICS.trace('daily_button'), METRICS.timer('interaction', component='daily_button'):
+            await self.runner.show_daily(interaction=interaction)
 
 
 class ForecastDatetimeSelect(discord.ui.Select):
-    def __init__(self, runner: 'Runner', times: list[datetime.datetime]):
-        super().__init__(options=[
-            discord.SelectOption(label=time.strftime('%m月%d日%H時%M分'), value=time.isoformat()) for time in times[0:25]
-        ])
+    def __init__(self, runner: 'Runner', options: list[discord.SelectOption]):
+        # The options come from EmbedRenderer and are shared, so the Select gets its own list.
+        super().__init__(options=list(options))
         self.runner = runner
 
     async def callback(self, interaction: discord.Interaction):
-        await self.runner.change_forecast_datetime(
-            interaction=interaction, time=datetime.datetime.fromisoformat(self.values[0]))
+        with METRICS.trace('forecast_select'), METRICS.timer('interaction', component='forecast_select'):
+            await self.runner.change_forecast_datetime(
+                interaction=interaction, time=datetime.datetime.fromisoformat(self.values[0]))
 
 
 class PlaceSelect(discord.ui.Select):
@@ -100,102 +130,117 @@ class InputPlaceModal(discord.ui.Modal):
         await interaction.response.defer()
 
 
+# Static parts of every window, shared by all Runners; each Windows works on its own shallow copies.
+WINDOW_EMBEDS: Final[tuple[dict, ...]] = (
+    {'title': 'お天気 Bot', 'thumbnail': {'url': OWM.OPEN_WEATHER_ICON_WITH_TEXT_URL}},
+    {'title': '', 'description': 'status'},
+    {'title': 'city name', 'description': 'status'},
+    {'title': 'お天気設定', 'description': 'under construction'},
+    {'title': '天気予報設定', 'description': 'under construction'},
+    {'title': 'お天気通知設定', 'description': 'under construction'},
+    {'title': '天気予報通知設定', 'description': 'under construction'},
+    {'title': 'city name', 'description': 'status'}
+)
+# Sent instead of a window when OWM has no answer in time and nothing is cached, so the interaction is still answered.
+UNAVAILABLE_EMBED: Final[dict] = {'title': 'お天気 Bot', 'description': '天気情報を取得できませんでした。しばらくしてからもう一度お試しください。'}
+
+
 class Windows(base.ExWindows):
     def __init__(self, runner: 'Runner'):
+        self.runner = runner
         super().__init__(
             windows=(
-                base.ExWindow(embed_dict={
-                    'title': 'お天気 Bot',
-                    'thumbnail': {
-                        'url': OWM.OPEN_WEATHER_ICON_WITH_TEXT_URL
-                    }
-                }, view_items=[
+                base.ExWindow(embed_dict=dict(WINDOW_EMBEDS[WinID.MENU]), view_items=[
                     WeatherButton(window=self, runner=runner),
                     ForecastButton(runner=runner),
+                    DailyButton(runner=runner),
                     Button(window=self, index=WinID.WEATHER_NOTICE_SETTING,
                            label='お天気通知設定', style=discord.ButtonStyle.primary),
                     Button(window=self, index=WinID.FORECAST_NOTICE_SETTING,
                            label='天気予報通知設定', style=discord.ButtonStyle.primary)
                 ]),
-                base.ExWindow(embed_dict={
-                    'title': '', 'description': 'status'
-                }, view_items=[
+                base.ExWindow(embed_dict=dict(WINDOW_EMBEDS[WinID.WEATHER]), view_items=[
                     Button(window=self, index=WinID.MENU, label='戻る'),
                     Button(window=self, index=WinID.WEATHER_SETTING, label='追加', style=discord.ButtonStyle.primary)
                 ]),
-                base.ExWindow(embed_dict={
-                    'title': 'city name', 'description': 'status'
-                }, view_items=[
+                base.ExWindow(embed_dict=dict(WINDOW_EMBEDS[WinID.FORECAST]), view_items=[
                     None,
                     Button(window=self, index=WinID.FORECAST_SETTING, label='追加', style=discord.ButtonStyle.primary),
                     Button(window=self, index=WinID.MENU, label='戻る')
                 ]),
-                base.ExWindow(
-                    embed_dict={
-                        'title': 'お天気設定', 'description': 'under construction'
-                    },
-                    view_items=[
-                        Button(window=self, index=WinID.WEATHER, label='戻る')
-                    ]
-                ),
-                base.ExWindow(
-                    embed_dict={
-                        'title': '天気予報設定', 'description': 'under construction'
-                    },
-                    view_items=[
-                        Button(window=self, index=WinID.FORECAST, label='戻る')
-                    ]
-                ),
-                base.ExWindow(
-                    embed_dict={
-                        'title': 'お天気通知設定', 'description': 'under construction'
-                    },
-                    view_items=[
-                        Button(window=self, index=WinID.MENU, label='戻る')
-                    ]
-                ),
-                base.ExWindow(
-                    embed_dict={
-                        'title': '天気予報通知設定', 'description': 'under construction'
-                    },
-                    view_items=[
-                        Button(window=self, index=WinID.MENU, label='戻る')
-                    ]
-                )
+                base.ExWindow(embed_dict=dict(WINDOW_EMBEDS[WinID.WEATHER_SETTING]), view_items=[
+                    Button(window=self, index=WinID.WEATHER, label='戻る')
+                ]),
+                base.ExWindow(embed_dict=dict(WINDOW_EMBEDS[WinID.FORECAST_SETTING]), view_items=[
+                    Button(window=self, index=WinID.FORECAST, label='戻る')
+                ]),
+                base.ExWindow(embed_dict=dict(WINDOW_EMBEDS[WinID.WEATHER_NOTICE_SETTING]), view_items=[
+                    Button(window=self, index=WinID.MENU, label='戻る')
+                ]),
+                base.ExWindow(embed_dict=dict(WINDOW_EMBEDS[WinID.FORECAST_NOTICE_SETTING]), view_items=[
+                    Button(window=self, index=WinID.MENU, label='戻る')
+                ]),
+                base.ExWindow(embed_dict=dict(WINDOW_EMBEDS[WinID.DAILY]), view_items=[
+                    ForecastButton(runner=runner),
+                    Button(window=self, index=WinID.MENU, label='戻る')
+                ])
             )
         )
 
 
 class Runner(base.Runner):
-    def __init__(self, channel: discord.TextChannel):
+    def __init__(self, channel: discord.TextChannel, owm: OWM, registry: Optional[RunnerRegistry['Runner']] = None,
+                 renderer: Optional[EmbedRenderer] = None):
         super().__init__(channel=channel)
         self.window: base.IWindow = Windows(runner=self)
-        self.owm = OWM()
+        self.owm = owm
+        self.registry = registry
+        self.renderer = renderer if renderer is not None else EmbedRenderer()
+        # The select is rebuilt only when the forecast behind it is refetched.
+        self._select: Optional[tuple[Forecast, ForecastDatetimeSelect]] = None
+
+    def touch(self, interaction: discord.Interaction):
+        # Keeps the Runner alive in the registry for as long as its view is being used.
+        if self.registry is not None:
+            self.registry.touch(channel=self.channel, user=interaction.user)
 
     async def run(self):
         await self.window.send(sender=self.channel, index=WinID.MENU)
 
+    async def answer_unavailable(self, interaction: discord.Interaction):
+        await interaction.response.send_message(embed=discord.Embed.from_dict(UNAVAILABLE_EMBED), ephemeral=True)
+
     async def change_forecast_datetime(self, interaction: discord.Interaction,
-                                       time: datetime = datetime.datetime.now(tz=ZONE_TOKYO)):
-        forecast = await self.owm.get_forecast(lat=35.689, lon=139.692)
-        weather = forecast.get_forecast_at(time)
-        embed_dict = self.window.get_embed_dict(index=WinID.FORECAST)
-        embed_dict['title'] = '{}'.format(weather.city.name)
-        embed_dict['description'] = '{0}時点でのお天気は{1}と予測されています。'.format(
-            weather.time.strftime('%Y年%m月%d日%H時%M分'), weather.conditions[0].description
-        )
-        embed_dict['thumbnail'] = {'url': weather.get_icon_url()}
-        embed_dict['fields'] = [
-            {'name': '気温', 'value': '{}°C'.format(weather.main.temperature), 'inline': True},
-            {'name': '最高気温', 'value': '{}°C'.format(weather.main.temperature_max), 'inline': True},
-            {'name': '最低気温', 'value': '{}°C'.format(weather.main.temperature_min), 'inline': True},
-            {'name': '湿度', 'value': '{}%'.format(weather.main.humidity), 'inline': True},
-            {'name': '気圧', 'value': '{}hPa'.format(weather.main.pressure), 'inline': True}
-        ]
-        embed_dict['footer'] = {'text': 'OpenWeatherを参照しています。', 'url': OWM.OPEN_WEATHER_ICON_URL}
-        view_items = self.window.get_view_items(index=WinID.FORECAST)
-        view_items[0] = ForecastDatetimeSelect(runner=self, times=forecast.get_datetime_list())
-        await self.window.response_edit(interaction=interaction, index=WinID.FORECAST)
+                                       time: Optional[datetime.datetime] = None):
+        self.touch(interaction=interaction)
+        if time is None:
+            time = datetime.datetime.now(tz=ZONE_TOKYO)
+        try:
+            forecast = await self.owm.get_forecast(lat=DEFAULT_LAT, lon=DEFAULT_LON)
+        except UPSTREAM_ERRORS:
+            await self.answer_unavailable(interaction=interaction)
+            return
+        embed_dict = self.renderer.forecast(lat=DEFAULT_LAT, lon=DEFAULT_LON, forecast=forecast, time=time)
+        if embed_dict is not None:
+            self.window.get_embed_dict(index=WinID.FORECAST).update(embed_dict)
+        if self._select is None or self._select[0] is not forecast:
+            options = self.renderer.options(lat=DEFAULT_LAT, lon=DEFAULT_LON, forecast=forecast)
+            self._select = (forecast, ForecastDatetimeSelect(runner=self, options=options))
+        self.window.get_view_items(index=WinID.FORECAST)[0] = self._select[1]
+        with METRICS.timer('discord_edit'):
+            await self.window.response_edit(interaction=interaction, index=WinID.FORECAST)
+
+    async def show_daily(self, interaction: discord.Interaction):
+        self.touch(interaction=interaction)
+        try:
+            forecast = await self.owm.get_forecast(lat=DEFAULT_LAT, lon=DEFAULT_LON)
+        except UPSTREAM_ERRORS:
+            await self.answer_unavailable(interaction=interaction)
+            return
+        self.window.get_embed_dict(index=WinID.DAILY).update(
+            self.renderer.daily(lat=DEFAULT_LAT, lon=DEFAULT_LON, forecast=forecast))
+        with METRICS.timer('discord_edit'):
+            await self.window.response_edit(interaction=interaction, index=WinID.DAILY)
 
     async def add_new_place(self, lat: int, lon: int, interaction: discord.Interaction):
         pass
@@ -204,54 +249,152 @@ class Runner(base.Runner):
 class Weather(base.Command):
     def __init__(self, bot: discord.ext.commands.Bot):
         super().__init__(bot=bot)
-        self.owm = OWM()
-        self.database_connector = psycopg2.connect(DATABASE_URL)
-        with self.database_connector.cursor() as cur:
-            cur.execute(
-                'CREATE TABLE IF NOT EXISTS weather (channel_id BIGINT, time TIME, interval INTERVAL, last TIMESTAMP, is_forecast BOOLEAN, lat REAL, lon REAL)'
-            )
-            self.database_connector.commit()
-            cur.execute(
-                'SELECT time FROM weather'
-            )
-            results = cur.fetchall()
-            self.database_connector.commit()
-        self.notice_weather.change_interval(time=DEFAULT_TIMES + [result[0] for result in results])
-        self.notice_weather.start()
+        self.owm = OWM(limiter=RateLimiter(processes=PROCESSES if SHARDED else 1),
+                       snapshots=SnapshotStore() if SNAPSHOT_PATH else None)
+        self.renderer = EmbedRenderer()
+        self.registry: RunnerRegistry[Runner] = RunnerRegistry(
+            factory=lambda channel: Runner(channel=channel, owm=self.owm, registry=self.registry,
+                                           renderer=self.renderer))
+        self.storage = Storage()
+        self.dispatcher = NoticeDispatcher(owm=self.owm, storage=self.storage,
+                                           send_weather=self.send_weather, send_forecast=self.send_forecast,
+                                           owner=INSTANCE_ID if SHARDED else None,
+                                           partitions=PROCESSES if SHARDED else 1,
+                                           partition=PROCESS_INDEX if SHARDED else 0)
+        self.scheduler = NoticeScheduler(on_due=self.notice_weather,
+                                         poll_interval=NOTICE_POLL_INTERVAL if SHARDED else None)
+        self.prefetcher = Prefetcher(owm=self.owm, upcoming=self._upcoming_targets)
+        self._bootstrap: Optional[asyncio.Task] = None
+        # Why the last attempt to start storage failed, while the next one is pending.
+        self._bootstrap_error: Optional[Exception] = None
+
+    def collect_metrics(self) -> list[tuple[str, dict[str, str], float]]:
+        return [('runners_' + name, {}, value) for name, value in self.registry.report().items()] + \
+            [('render_' + name, {}, value) for name, value in self.renderer.stats.as_dict().items()] + \
+            [('scheduled_subscriptions', {}, len(self.scheduler))]
+
+    def _upcoming_targets(self, seconds: float) -> list[tuple[float, tuple[str, float, float]]]:
+        # Subscriptions are warmed just before they fire; only the default location is kept warm all the time. A
+        # sharded process warms only the ones it will claim itself.
+        now = datetime.datetime.now(tz=ZONE_TOKYO)
+        return [((subscription.next_fire_at - now).total_seconds(),
+                 subscription_target(is_forecast=subscription.is_forecast, lat=subscription.lat, lon=subscription.lon))
+                for subscription in self.scheduler.upcoming(until=now + datetime.timedelta(seconds=seconds))
+                if self.dispatcher.prefers(subscription=subscription)]
+
+    def _collectors(self) -> list[Callable[[], list[tuple[str, dict[str, str], float]]]]:
+        return [self.owm.collect_metrics, self.prefetcher.collect_metrics, self.collect_metrics]
+
+    async def cog_load(self):
+        if METRICS.enabled:
+            METRICS.collectors.extend(self._collectors())
+            await METRICS.start_server()
+        self.prefetcher.sync(targets=DEFAULT_TARGETS)
+        self.prefetcher.start()
+        # Postgres and the scheduler come up in the background so they do not hold up the gateway connection.
+        self._bootstrap = asyncio.create_task(self._bootstrap_storage())
+
+    async def _start_storage(self):
+        await self.storage.connect()
+        subscriptions = await self.storage.fetch_subscriptions()
+        updates = self.scheduler.load(subscriptions=subscriptions)
+        if updates:
+            await self.storage.backfill_many(updates=updates)
+        self.scheduler.start()
+        METRICS.mark('storage_ready')
+
+    async def _bootstrap_storage(self):
+        # Retried until it succeeds or the cog unloads, so an outage at start-up only delays notices.
+        delay = BOOTSTRAP_RETRY_MIN
+        while True:
+            try:
+                await self._start_storage()
+                self._bootstrap_error = None
+                return
+            except Exception as error:
+                self._bootstrap_error = error
+                logger.exception('starting storage and the notice scheduler failed, retrying in %.0fs', delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, BOOTSTRAP_RETRY_MAX)
+
+    async def _storage_ready(self):
+        if not self._bootstrap.done() and self._bootstrap_error is not None:
+            # Fails the command with the reason rather than holding it until Postgres is back.
+            raise self._bootstrap_error.with_traceback(None)
+        # Shielded so a cancelled command does not cancel the start-up shared by everyone else.
+        await asyncio.shield(self._bootstrap)
+
+    def _storage_started(self) -> bool:
+        return self._bootstrap is not None and self._bootstrap.done() and not self._bootstrap.cancelled() \
+            and self._bootstrap.exception() is None
+
+    async def cog_unload(self):
+        if self._bootstrap is not None and not self._bootstrap.done():
+            self._bootstrap.cancel()
+        self.prefetcher.stop()
+        self.scheduler.stop()
+        # A run that is sending finishes and records what it sent, or those rows would go out again.
+        await self.scheduler.drain()
+        if self.dispatcher.owner is not None and self._storage_started():
+            # Hands unsent rows back at once instead of making the other processes wait out the lease.
+            await self.storage.release_leases(owner=self.dispatcher.owner)
+        # METRICS outlives the cog: left in place, a reloaded extension would export every gauge twice and keep
+        # this cog alive.
+        for collector in self._collectors():
+            if collector in METRICS.collectors:
+                METRICS.collectors.remove(collector)
+        await METRICS.stop_server()
+        await self.owm.close()
+        await self.storage.close()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        METRICS.mark('gateway_ready')
+
+    async def cog_before_invoke(self, ctx: discord.ext.commands.Context):
+        if METRICS.mark('first_command') and 'gateway_ready' in METRICS.startup:
+            logger.info('start-up: first command %.3fs after gateway ready',
+                        METRICS.startup['first_command'] - METRICS.startup['gateway_ready'])
 
     @commands.command()
     async def weather(self, ctx: discord.ext.commands.Context):
-        self.runners.append(Runner(channel=ctx.channel))
-        await self.runners[len(self.runners) - 1].run()
-
-    async def send_weather(self, channel_id: int, lat: float, lon: float):
-        pass
-
-    async def send_forecast(self, channel_id: int, lat: float, lon: float, date: datetime):
-        pass
-
-    @tasks.loop(time=DEFAULT_TIMES)
-    async def notice_weather(self):
-        with self.database_connector.cursor() as cur:
-            cur.execute(
-                'SELECT channel_id, interval, last, lat, lon FROM weather WHERE %s < time AND time < %s',
-                ((datetime.datetime.now() - datetime.timedelta(minutes=1)).time(),
-                 (datetime.datetime.now() + datetime.timedelta(minutes=1)).time())
-            )
-            results = cur.fetchall()
-            self.database_connector.commit()
-        updates = []
-        for result in results:
-            if result[1] + datetime.datetime.fromtimestamp(result[2], tz=ZONE_TOKYO) - datetime.timedelta(
-                    minutes=1) <= datetime.datetime.now():
-                updates.append((result[0], datetime.datetime.now()))
-                await self.send_weather(channel_id=result[0], lat=result[3], lon=result[5])
-        with self.database_connector.cursor() as cur:
-            for update in updates:
-                cur.execute(
-                    'UPDATE weather SET last = %s WHERE channel_id = %s',
-                    (update[1], update[0])
-                )
+        await self.registry.get(channel=ctx.channel, user=ctx.author).run()
+
+    async def _get_channel(self, channel_id: int) -> discord.abc.Messageable:
+        return self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+
+    async def send_weather(self, subscription: Subscription, weather: WeatherData):
+        channel = await self._get_channel(channel_id=subscription.channel_id)
+        await channel.send(embed=discord.Embed.from_dict(
+            self.renderer.weather(lat=subscription.lat, lon=subscription.lon, weather=weather)))
+
+    async def send_forecast(self, subscription: Subscription, forecast: Forecast):
+        embed_dict = self.renderer.forecast(lat=subscription.lat, lon=subscription.lon, forecast=forecast,
+                                            time=datetime.datetime.now(tz=ZONE_TOKYO))
+        if embed_dict is None:
+            return
+        channel = await self._get_channel(channel_id=subscription.channel_id)
+        await channel.send(embed=discord.Embed.from_dict(embed_dict))
+
+    async def add_subscription(self, channel_id: int, time: datetime.time, is_forecast: bool, lat: float, lon: float,
+                               interval: datetime.timedelta = DEFAULT_INTERVAL):
+        subscription = Subscription(id=0, channel_id=channel_id, time=time, interval=interval, last=None,
+                                    is_forecast=is_forecast, lat=lat, lon=lon)
+        fire_at = next_fire_at(subscription=subscription, now=datetime.datetime.now(tz=ZONE_TOKYO))
+        await self._storage_ready()
+        id = await self.storage.add_subscription(channel_id=channel_id, time=time, interval=interval,
+                                                 is_forecast=is_forecast, lat=lat, lon=lon, next_fire_at=fire_at)
+        self.scheduler.add(subscription=subscription._replace(id=id))
+
+    async def remove_subscription(self, subscription: Subscription):
+        await self._storage_ready()
+        await self.storage.remove_subscription(id=subscription.id)
+        self.scheduler.remove(subscription=subscription)
+
+    async def notice_weather(self, subscriptions: list[Subscription], now: datetime.datetime) -> frozenset[int]:
+        with METRICS.trace('notice_weather'), METRICS.timer('notice_run'):
+            report = await self.dispatcher.dispatch(subscriptions=subscriptions, now=now)
+        return report.undelivered
 
 
 async def setup(bot: discord.ext.commands.Bot):
@@ -0,0 +1,192 @@
+import bisect
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Final, Optional, TypeVar
+
+from aiohttp import web
+
+METRICS_PORT: Final[Optional[str]] = os.getenv('WEATHER_METRICS_PORT')
+TRACE_ENABLED: Final[bool] = os.getenv('WEATHER_TRACE', '') not in ('', '0')
+DEFAULT_BUCKETS: Final[tuple[float, ...]] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX: Final[str] = 'weather_'
+# Start-up phases are measured from here; this module is among the first the bot imports.
+STARTED: Final[float] = time.monotonic()
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar('F', bound=Callable[..., Awaitable[Any]])
+Labels = tuple[tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    labels = labels + extra
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(key, str(value).replace('"', '\\"')) for key, value in labels) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: Labels) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append('{0}_bucket{1} {2}'.format(name, _format_labels(labels, (('le', repr(bound)),)), cumulative))
+        lines.append('{0}_bucket{1} {2}'.format(name, _format_labels(labels, (('le', '+Inf'),)), self.count))
+        lines.append('{0}_sum{1} {2}'.format(name, _format_labels(labels), self.sum))
+        lines.append('{0}_count{1} {2}'.format(name, _format_labels(labels), self.count))
+        return lines
+
+
+class Trace:
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans: list[tuple[str, float]] = []
+
+    def summary(self) -> str:
+        return '{0} took {1:.1f} ms: {2}'.format(
+            self.name, (time.perf_counter() - self.started) * 1e3,
+            ', '.join('{0} {1:.1f} ms'.format(name, seconds * 1e3) for name, seconds in self.spans) or 'no spans')
+
+
+_NULL_CONTEXT: Final[contextlib.nullcontext] = contextlib.nullcontext()
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('weather_trace', default=None)
+
+
+class Metrics:
+    def __init__(self, enabled: bool = METRICS_PORT is not None, tracing: bool = TRACE_ENABLED):
+        self.enabled = enabled
+        self.tracing = tracing
+        self.histograms: dict[tuple[str, Labels], Histogram] = {}
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.gauges: dict[tuple[str, Labels], float] = {}
+        # Callables polled at scrape time, returning (name, labels, value) gauges such as pool or cache statistics.
+        self.collectors: list[Callable[[], list[tuple[str, dict[str, str], float]]]] = []
+        # Seconds from start to each start-up phase, recorded once even while metrics are disabled.
+        self.startup: dict[str, float] = {}
+        self._server: Optional[web.AppRunner] = None
+
+    def inc(self, name: str, labels: Labels, value: float = 1.0):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def add(self, name: str, labels: Labels, value: float):
+        key = (name, labels)
+        self.gauges[key] = self.gauges.get(key, 0.0) + value
+
+    def observe(self, name: str, labels: Labels, value: float):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    @contextlib.contextmanager
+    def _timer(self, name: str, labels: Labels):
+        self.add(name + '_in_flight', labels, 1)
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc(name + '_errors_total', labels)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.add(name + '_in_flight', labels, -1)
+            self.observe(name + '_seconds', labels, elapsed)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.spans.append((name if not labels else '{0}[{1}]'.format(
+                    name, ','.join(value for _, value in labels)), elapsed))
+
+    def timer(self, name: str, **labels: str) -> contextlib.AbstractContextManager:
+        # Latency histogram, error counter and in-flight gauge for the wrapped block; a no-op while disabled.
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timer(name, tuple(sorted(labels.items())))
+
+    def timed(self, name: str, **labels: str) -> Callable[[F], F]:
+        def decorator(function: F) -> F:
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return await function(*args, **kwargs)
+                with self.timer(name, **labels):
+                    return await function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextlib.contextmanager
+    def _trace(self, name: str):
+        trace = Trace(name=name)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            logger.info('trace %s', trace.summary())
+
+    def trace(self, name: str) -> contextlib.AbstractContextManager:
+        # Collects the timers run inside the block into one logged per-interaction breakdown.
+        if not (self.enabled and self.tracing):
+            return _NULL_CONTEXT
+        return self._trace(name)
+
+    def mark(self, phase: str) -> bool:
+        if phase in self.startup:
+            return False
+        self.startup[phase] = time.monotonic() - STARTED
+        logger.info('start-up: %s after %.3fs', phase, self.startup[phase])
+        return True
+
+    def render(self) -> str:
+        lines = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append('{0}{1}{2} {3}'.format(PREFIX, name, _format_labels(labels), value))
+        for (name, labels), value in sorted(self.gauges.items()):
+            lines.append('{0}{1}{2} {3}'.format(PREFIX, name, _format_labels(labels), value))
+        for phase, seconds in self.startup.items():
+            lines.append('{0}startup_seconds{1} {2}'.format(PREFIX, _format_labels((('phase', phase),)), seconds))
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            lines.extend(histogram.render(name=PREFIX + name, labels=labels))
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                lines.append('{0}{1}{2} {3}'.format(PREFIX, name, _format_labels(tuple(sorted(labels.items()))), value))
+        return '\n'.join(lines) + '\n'
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type='text/plain', charset='utf-8')
+
+    async def start_server(self, host: str = '127.0.0.1', port: int = int(METRICS_PORT or 9100)):
+        if self._server is not None:
+            return
+        app = web.Application()
+        app.add_routes([web.get('/metrics', self._handle)])
+        self._server = web.AppRunner(app, access_log=None)
+        await self._server.setup()
+        await web.TCPSite(self._server, host=host, port=port).start()
+
+    async def stop_server(self):
+        if self._server is not None:
+            await self._server.cleanup()
+            self._server = None
+
+
+METRICS: Final[Metrics] = Metrics()
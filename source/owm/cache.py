@@ -0,0 +1,108 @@
+import collections
+import time
+from typing import Any, Callable, Final, Hashable, Optional
+
+CURRENT_WEATHER: Final[str] = 'weather'
+FORECAST: Final[str] = 'forecast'
+
+DEFAULT_TTLS: Final[dict[str, float]] = {
+    CURRENT_WEATHER: 10 * 60,
+    FORECAST: 30 * 60
+}
+# How long past its TTL an entry may still be served when OWM is unavailable.
+DEFAULT_STALE_TTL: Final[float] = 6 * 60 * 60
+DEFAULT_MAXSIZE: Final[int] = 1024
+DEFAULT_PRECISION: Final[int] = 2
+
+
+def quantize(lat: float, lon: float, precision: int = DEFAULT_PRECISION) -> tuple[float, float]:
+    # Two decimals is roughly 1 km, well below the resolution of OWM's models.
+    return round(lat, precision), round(lon, precision)
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'stale_hits': self.stale_hits,
+            'hit_ratio': self.hit_ratio
+        }
+
+
+class ResponseCache:
+    def __init__(self, ttls: Optional[dict[str, float]] = None, maxsize: int = DEFAULT_MAXSIZE,
+                 precision: int = DEFAULT_PRECISION, stale_ttl: float = DEFAULT_STALE_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self.precision = precision
+        self.clock = clock
+        self.stats = CacheStats()
+        self._entries: collections.OrderedDict[Hashable, tuple[float, Any]] = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, endpoint: str, lat: float, lon: float) -> tuple[str, float, float]:
+        return (endpoint,) + quantize(lat=lat, lon=lon, precision=self.precision)
+
+    def get(self, endpoint: str, lat: float, lon: float) -> Optional[Any]:
+        key = self.key(endpoint=endpoint, lat=lat, lon=lon)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        expires_at, value = entry
+        now = self.clock()
+        if expires_at <= now:
+            # Expired entries are kept for get_stale until they are past the stale window too.
+            if expires_at + self.stale_ttl <= now:
+                del self._entries[key]
+                self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def get_stale(self, endpoint: str, lat: float, lon: float) -> Optional[Any]:
+        entry = self._entries.get(self.key(endpoint=endpoint, lat=lat, lon=lon))
+        if entry is None or entry[0] + self.stale_ttl <= self.clock():
+            return None
+        self.stats.stale_hits += 1
+        return entry[1]
+
+    def expires_at(self, endpoint: str, lat: float, lon: float) -> Optional[float]:
+        entry = self._entries.get(self.key(endpoint=endpoint, lat=lat, lon=lon))
+        return entry[0] if entry is not None else None
+
+    def put(self, endpoint: str, lat: float, lon: float, value: Any, age: float = 0.0):
+        # age backdates values that were fetched earlier, such as snapshots restored from disk.
+        key = self.key(endpoint=endpoint, lat=lat, lon=lon)
+        self._entries[key] = (self.clock() + self.ttls[endpoint] - age, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def invalidate(self, endpoint: str, lat: float, lon: float):
+        self._entries.pop(self.key(endpoint=endpoint, lat=lat, lon=lon), None)
+
+    def clear(self):
+        self._entries.clear()
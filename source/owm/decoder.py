@@ -0,0 +1,141 @@
+import datetime
+import functools
+import json
+import os
+from typing import Any, Final, Optional
+
+from .models import Forecast, Weather, ZONE_TOKYO
+
+DIRECTORY_NAME: Final[str] = os.path.dirname(__file__)
+
+_EMPTY: Final[dict] = {}
+
+Fields = tuple[tuple[str, Any], ...]
+
+
+def _compile(template: Optional[dict], keys: tuple[str, ...]) -> Fields:
+    # Pairs each JSON key with the default the template gives it, in the order of the model's fields.
+    template = template or _EMPTY
+    return tuple((key, template.get(key)) for key in keys)
+
+
+def _read(data: Optional[dict], fields: Fields) -> list:
+    if not data:
+        return [default for _, default in fields]
+    return [data.get(key, default) for key, default in fields]
+
+
+def _timestamp(value: Optional[int]) -> Optional[datetime.datetime]:
+    return None if value is None else datetime.datetime.fromtimestamp(value, tz=ZONE_TOKYO)
+
+
+def _timezone(value: Optional[int]) -> Optional[datetime.timezone]:
+    return None if value is None else datetime.timezone(offset=datetime.timedelta(seconds=value))
+
+
+class _EntryDecoder:
+    def __init__(self, template: dict):
+        self.condition = _compile(template['weather'][0], ('id', 'main', 'description', 'icon'))
+        # What the template gives an entry without conditions; renderers always read the first one.
+        self.default_condition = Weather.Condition._make(_read(None, self.condition))
+        self.main = _compile(template['main'], (
+            'temp', 'feels_like', 'temp_min', 'temp_max', 'pressure', 'humidity', 'sea_level', 'grnd_level'))
+        self.wind = _compile(template['wind'], ('speed', 'deg', 'gust'))
+        self.clouds = _compile(template['clouds'], ('all',))
+        self.rain = _compile(template.get('rain'), ('1h', '3h'))
+        self.snow = _compile(template.get('snow'), ('1h', '3h'))
+        self.dt = template.get('dt')
+        self.visibility = template.get('visibility')
+        self.pop = template.get('pop')
+
+    def decode(self, data: dict, city: Weather.City, timezone: Optional[datetime.timezone]) -> Weather:
+        condition = self.condition
+        weathers = data.get('weather')
+        return Weather(
+            city=city,
+            conditions=[Weather.Condition._make(_read(_weather, condition)) for _weather in weathers]
+            if weathers else [self.default_condition],
+            main=Weather.Main._make(_read(data.get('main'), self.main)),
+            wind=Weather.Wind._make(_read(data.get('wind'), self.wind)),
+            rain=Weather.Rain._make(_read(data.get('rain'), self.rain)),
+            clouds=Weather.Clouds._make(_read(data.get('clouds'), self.clouds)),
+            snow=Weather.Snow._make(_read(data.get('snow'), self.snow)),
+            time=_timestamp(data.get('dt', self.dt)),
+            timezone=timezone,
+            visibility=data.get('visibility', self.visibility),
+            probability=data.get('pop', self.pop)
+        )
+
+
+class CurrentWeatherDecoder:
+    def __init__(self, template: dict):
+        self.entry = _EntryDecoder(template=template)
+        self.coord = _compile(template['coord'], ('lat', 'lon'))
+        self.sys = _compile(template['sys'], ('country', 'sunrise', 'sunset'))
+        self.name = template.get('name')
+        self.id = template.get('id')
+        self.timezone = template.get('timezone')
+
+    def decode(self, data: dict) -> Weather:
+        lat, lon = _read(data.get('coord'), self.coord)
+        country, sunrise, sunset = _read(data.get('sys'), self.sys)
+        city = Weather.City(lat=lat, lon=lon, country=country, name=data.get('name', self.name),
+                            sunrise=_timestamp(sunrise), sunset=_timestamp(sunset), id=data.get('id', self.id))
+        return self.entry.decode(data=data, city=city, timezone=_timezone(data.get('timezone', self.timezone)))
+
+
+def group_entries(data: dict) -> list[dict]:
+    # /data/2.5/group lists current weather payloads with the timezone moved under sys.
+    entries = []
+    for entry in data.get('list') or ():
+        if 'timezone' not in entry:
+            entry = dict(entry, timezone=(entry.get('sys') or _EMPTY).get('timezone'))
+        entries.append(entry)
+    return entries
+
+
+class ForecastDecoder:
+    def __init__(self, template: dict):
+        city = template['city']
+        self.entry = _EntryDecoder(template=template['list'][0])
+        self.coord = _compile(city['coord'], ('lat', 'lon'))
+        self.city = _compile(city, ('country', 'name', 'sunrise', 'sunset', 'timezone', 'id'))
+
+    def decode(self, data: dict) -> Forecast:
+        city_data = data.get('city')
+        lat, lon = _read(city_data.get('coord') if city_data else None, self.coord)
+        country, name, sunrise, sunset, timezone, id = _read(city_data, self.city)
+        # Every entry of a forecast is for the same city, so they all share one City and timezone.
+        city = Weather.City(lat=lat, lon=lon, country=country, name=name,
+                            sunrise=_timestamp(sunrise), sunset=_timestamp(sunset), id=id)
+        timezone = _timezone(timezone)
+        entry = self.entry
+        return Forecast(weathers=[
+            entry.decode(data=datum, city=city, timezone=timezone) for datum in data.get('list') or ()
+        ])
+
+
+def _load_template(name: str) -> dict:
+    with open(os.path.join(DIRECTORY_NAME, name), 'r') as f:
+        return json.load(f)
+
+
+# The templates are read and compiled on first use rather than at import, keeping them off the start-up path.
+@functools.cache
+def current_weather_template() -> dict:
+    return _load_template(name='current_weather_temp.json')
+
+
+@functools.cache
+def forecast_template() -> dict:
+    return _load_template(name='forecast_temp.json')
+
+
+@functools.cache
+def current_weather_decoder() -> CurrentWeatherDecoder:
+    return CurrentWeatherDecoder(template=current_weather_template())
+
+
+@functools.cache
+def forecast_decoder() -> ForecastDecoder:
+    return ForecastDecoder(template=forecast_template())
@@ -0,0 +1,277 @@
+import array
+import bisect
+import collections
+import datetime
+import functools
+import math
+import zoneinfo
+from typing import Optional, Final, NamedTuple
+
+ZONE_TOKYO: Final[zoneinfo.ZoneInfo] = zoneinfo.ZoneInfo('Asia/Tokyo')
+
+
+class Weather:
+    __slots__ = ('city', 'conditions', 'main', 'wind', 'rain', 'clouds', 'snow', 'time', 'timezone', 'visibility',
+                 'probability')
+
+    class City(NamedTuple):
+        lat: Optional[int]
+        lon: Optional[int]
+        country: Optional[str]
+        name: Optional[str]
+        sunrise: Optional[datetime.datetime]
+        sunset: Optional[datetime.datetime]
+        id: Optional[int] = None
+
+    class Condition(NamedTuple):
+        id: Optional[int]
+        main: Optional[str]
+        description: Optional[str]
+        icon: Optional[str]
+
+    class Main(NamedTuple):
+        temperature: Optional[float]
+        feels_like: Optional[float]
+        temperature_min: Optional[float]
+        temperature_max: Optional[float]
+        pressure: Optional[int]
+        humidity: Optional[float]
+        sea_level: Optional[int]
+        ground_level: Optional[int]
+
+    class Wind(NamedTuple):
+        speed: Optional[float]
+        degrees: Optional[int]
+        gust: Optional[float]
+
+    class Rain(NamedTuple):
+        an_hour: Optional[float]
+        three_hour: Optional[float]
+
+    class Clouds(NamedTuple):
+        cloudiness: Optional[float]
+
+    class Snow(NamedTuple):
+        an_hour: Optional[float]
+        three_hour: Optional[float]
+
+    def __init__(self, city: 'Weather.City', conditions: list['Weather.Condition'], main: 'Weather.Main',
+                 wind: 'Weather.Wind', rain: 'Weather.Rain', clouds: 'Weather.Clouds', snow: 'Weather.Snow',
+                 time: Optional[datetime.datetime], timezone: Optional[datetime.timezone], visibility: Optional[float],
+                 probability: Optional[float]):
+        self.city = city
+        self.conditions = conditions
+        self.main = main
+        self.wind = wind
+        self.rain = rain
+        self.clouds = clouds
+        self.snow = snow
+        self.time = time
+        self.timezone = timezone
+        self.visibility = visibility
+        self.probability = probability
+
+    def get_icon_url(self):
+        return 'https://openweathermap.org/img/wn/{0}@4x.png'.format(self.conditions[0].icon)
+
+
+def _column(values) -> array.array:
+    return array.array('d', [math.nan if value is None else value for value in values])
+
+
+def _present(values) -> list[float]:
+    # NaN is the only value not equal to itself.
+    return [value for value in values if value == value]
+
+
+class DailySummary(NamedTuple):
+    # Aggregates of the entries falling on one local day; NaN where none of them had the value.
+    date: datetime.date
+    start: int
+    stop: int
+    temperature_min: float
+    temperature_max: float
+    temperature_mean: float
+    probability_max: float
+    rain: float
+    snow: float
+    condition: Optional[Weather.Condition]
+
+
+class ForecastRow:
+    __slots__ = ('forecast', 'index')
+
+    def __init__(self, forecast: 'Forecast', index: int):
+        self.forecast = forecast
+        self.index = index
+
+    @property
+    def time(self) -> datetime.datetime:
+        return self.forecast.times[self.index]
+
+    @property
+    def temperature(self) -> float:
+        return self.forecast.temperatures[self.index]
+
+    @property
+    def humidity(self) -> float:
+        return self.forecast.humidities[self.index]
+
+    @property
+    def pressure(self) -> float:
+        return self.forecast.pressures[self.index]
+
+    @property
+    def probability(self) -> float:
+        return self.forecast.probabilities[self.index]
+
+    @property
+    def weather(self) -> Weather:
+        return self.forecast.weathers[self.index]
+
+
+class ForecastSlice:
+    __slots__ = ('forecast', 'start', 'stop')
+
+    def __init__(self, forecast: 'Forecast', start: int, stop: int):
+        self.forecast = forecast
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        return (ForecastRow(forecast=self.forecast, index=index) for index in range(self.start, self.stop))
+
+    def _view(self, column: array.array) -> memoryview:
+        return memoryview(column)[self.start:self.stop]
+
+    @property
+    def timestamps(self) -> memoryview:
+        return self._view(self.forecast.timestamps)
+
+    @property
+    def temperatures(self) -> memoryview:
+        return self._view(self.forecast.temperatures)
+
+    @property
+    def humidities(self) -> memoryview:
+        return self._view(self.forecast.humidities)
+
+    @property
+    def pressures(self) -> memoryview:
+        return self._view(self.forecast.pressures)
+
+    @property
+    def probabilities(self) -> memoryview:
+        return self._view(self.forecast.probabilities)
+
+    @property
+    def rains(self) -> memoryview:
+        return self._view(self.forecast.rains)
+
+    @property
+    def snows(self) -> memoryview:
+        return self._view(self.forecast.snows)
+
+    def summarize(self, date: datetime.date) -> DailySummary:
+        temperatures = _present(self.temperatures)
+        probabilities = _present(self.probabilities)
+        # OWM leaves rain and snow out for dry slots, so missing volumes count as none.
+        rain = math.fsum(_present(self.rains))
+        snow = math.fsum(_present(self.snows))
+        # The most frequent condition; ties go to the earliest, as Counter keeps insertion order.
+        conditions = collections.Counter(weather.conditions[0] for weather in
+                                         self.forecast.weathers[self.start:self.stop] if weather.conditions)
+        return DailySummary(
+            date=date, start=self.start, stop=self.stop,
+            temperature_min=min(temperatures, default=math.nan),
+            temperature_max=max(temperatures, default=math.nan),
+            temperature_mean=math.fsum(temperatures) / len(temperatures) if temperatures else math.nan,
+            probability_max=max(probabilities, default=math.nan),
+            rain=rain, snow=snow,
+            condition=conditions.most_common(1)[0][0] if conditions else None
+        )
+
+
+class Forecast:
+    def __init__(self, weathers: list['Weather']):
+        # Entries without a time cannot be placed on the timeline, so only timed ones are kept, in time order.
+        self.weathers = sorted((weather for weather in weathers if weather.time is not None),
+                               key=lambda weather: weather.time)
+        self.times = [weather.time for weather in self.weathers]
+        self.timestamps = array.array('d', [time.timestamp() for time in self.times])
+        # Numeric columns hold NaN where OWM left a value out.
+        self.temperatures = _column(weather.main.temperature for weather in self.weathers)
+        self.humidities = _column(weather.main.humidity for weather in self.weathers)
+        self.pressures = _column(weather.main.pressure for weather in self.weathers)
+        self.probabilities = _column(weather.probability for weather in self.weathers)
+        self.rains = _column(weather.rain.three_hour for weather in self.weathers)
+        self.snows = _column(weather.snow.three_hour for weather in self.weathers)
+
+    def count(self):
+        return len(self.weathers)
+
+    def get_datetime_list(self) -> list[datetime.datetime]:
+        return self.times
+
+    def _nearest_index(self, date: datetime.datetime) -> int:
+        timestamp = date.timestamp()
+        index = bisect.bisect_left(self.timestamps, timestamp)
+        if index == 0:
+            return 0
+        if index == len(self.timestamps):
+            return index - 1
+        return index - 1 if timestamp - self.timestamps[index - 1] <= self.timestamps[index] - timestamp else index
+
+    def get_forecast_at(self, date: datetime.datetime) -> Optional[Weather]:
+        if len(self.weathers) == 0:
+            return None
+        return self.weathers[self._nearest_index(date)]
+
+    def get_row_at(self, date: datetime.datetime) -> Optional[ForecastRow]:
+        if len(self.weathers) == 0:
+            return None
+        return ForecastRow(forecast=self, index=self._nearest_index(date))
+
+    def get_forecast_index(self, index: int) -> Optional[Weather]:
+        return self.weathers[index]
+
+    def get_range(self, start: datetime.datetime, end: datetime.datetime) -> ForecastSlice:
+        # Entries with start <= time < end, as views on the columns rather than copies.
+        return ForecastSlice(forecast=self, start=bisect.bisect_left(self.timestamps, start.timestamp()),
+                             stop=bisect.bisect_left(self.timestamps, end.timestamp()))
+
+    @property
+    def timezone(self) -> datetime.tzinfo:
+        # Every entry shares the city's timezone; Tokyo is assumed when OWM did not send one.
+        for weather in self.weathers:
+            if weather.timezone is not None:
+                return weather.timezone
+        return ZONE_TOKYO
+
+    @functools.cached_property
+    def _daily(self) -> tuple[DailySummary, ...]:
+        # Entries are in time order, so each local day is one contiguous run of the columns, found by bisecting
+        # the timestamps at each local midnight.
+        timezone = self.timezone
+        days = []
+        start = 0
+        while start < len(self.timestamps):
+            date = self.times[start].astimezone(timezone).date()
+            midnight = datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time(), tzinfo=timezone)
+            stop = bisect.bisect_left(self.timestamps, midnight.timestamp(), lo=start + 1)
+            days.append(ForecastSlice(forecast=self, start=start, stop=stop).summarize(date=date))
+            start = stop
+        return tuple(days)
+
+    def get_daily(self) -> tuple[DailySummary, ...]:
+        # Computed once per Forecast, so it lives exactly as long as the cached forecast it summarizes.
+        return self._daily
+
+    def get_day(self, date: datetime.date) -> Optional[DailySummary]:
+        for summary in self._daily:
+            if summary.date == date:
+                return summary
+        return None
@@ -1,108 +1,37 @@
-import datetime
-import json
+import asyncio
+import functools
+import logging
 import os
-import zoneinfo
-from typing import Optional, Union, Final, NamedTuple
+import random
+from typing import Any, Awaitable, Callable, Iterable, Optional, Final
 
 import aiohttp
 
+from ..metrics import METRICS
+from .cache import CURRENT_WEATHER, FORECAST, ResponseCache
+from .decoder import current_weather_decoder, forecast_decoder, group_entries
+from .models import Forecast, Weather, ZONE_TOKYO
+from .pool import OWMHTTPError, SessionPool
+from .ratelimit import Priority, RateLimited, RateLimiter, Ticket
+from .singleflight import SingleFlight
+from .snapshot import SnapshotStore
+
 OWM_API_KEY: Final[str] = os.getenv('OWM_API_KEY')
-ZONE_TOKYO: Final[zoneinfo.ZoneInfo] = zoneinfo.ZoneInfo('Asia/Tokyo')
-
-print(__file__)
-DIRECTORY_NAME: Final[str] = os.path.dirname(__file__)
-with open(os.path.join(DIRECTORY_NAME, 'current_weather_temp.json'), 'r') as f:
-    CURRENT_WEATHER_DATA_TEMPLATE: Final[dict] = json.load(f)
-with open(os.path.join(DIRECTORY_NAME, 'forecast_temp.json'), 'r') as f:
-    FORECAST_DATA_TEMPLATE: Final[dict] = json.load(f)
-
-
-class Weather:
-
-    class City(NamedTuple):
-        lat: Optional[int]
-        lon: Optional[int]
-        country: Optional[str]
-        name: Optional[str]
-        sunrise: Optional[datetime.datetime]
-        sunset: Optional[datetime.datetime]
-
-    class Condition(NamedTuple):
-        id: Optional[int]
-        main: Optional[str]
-        description: Optional[str]
-        icon: Optional[str]
-
-    class Main(NamedTuple):
-        temperature: Optional[float]
-        feels_like: Optional[float]
-        temperature_min: Optional[float]
-        temperature_max: Optional[float]
-        pressure: Optional[int]
-        humidity: Optional[float]
-        sea_level: Optional[int]
-        ground_level: Optional[int]
-
-    class Wind(NamedTuple):
-        speed: Optional[float]
-        degrees: Optional[int]
-        gust: Optional[float]
-
-    class Rain(NamedTuple):
-        an_hour: Optional[float]
-        three_hour: Optional[float]
-
-    class Clouds(NamedTuple):
-        cloudiness: Optional[float]
-
-    class Snow(NamedTuple):
-        an_hour: Optional[float]
-        three_hour: Optional[float]
-
-    def __init__(self, city: 'Weather.City', conditions: list['Weather.Condition'], main: 'Weather.Main',
-                 wind: 'Weather.Wind', rain: 'Weather.Rain', clouds: 'Weather.Clouds', snow: 'Weather.Snow',
-                 time: Optional[datetime.datetime], timezone: Optional[datetime.timezone], visibility: Optional[float],
-                 probability: Optional[float]):
-        self.city = city
-        self.conditions = conditions
-        self.main = main
-        self.wind = wind
-        self.rain = rain
-        self.clouds = clouds
-        self.snow = snow
-        self.time = time
-        self.timezone = timezone
-        self.visibility = visibility
-        self.probability = probability
-
-    def get_icon_url(self):
-        return 'https://openweathermap.org/img/wn/{0}@4x.png'.format(self.conditions[0].icon)
-
-
-class Forecast:
-    def __init__(self, weathers: list['Weather']):
-        self.weathers = weathers
-
-    def count(self):
-        return len(self.weathers)
-
-    def get_datetime_list(self) -> list[datetime.datetime]:
-        return sorted([weather.time for weather in self.weathers])
-
-    def get_forecast_at(self, date: datetime.datetime) -> Optional[Weather]:
-        if len(self.weathers) == 0:
-            return None
-        else:
-            nearest_weather = self.weathers[0]
-            least_timedelta = abs(self.weathers[0].time - date)
-            for weather in self.weathers:
-                if abs(weather.time - date) < least_timedelta:
-                    nearest_weather = weather
-                    least_timedelta = abs(weather.time - date)
-            return nearest_weather
-
-    def get_forecast_index(self, index: int) -> Optional[Weather]:
-        return self.weathers[index]
+OWM_BASE_URL: Final[str] = os.getenv('OWM_BASE_URL', 'https://api.openweathermap.org')
+# City ids per /data/2.5/group request; OWM allows up to 20. 0 sends every location on its own.
+OWM_GROUP_SIZE: Final[int] = int(os.getenv('OWM_GROUP_SIZE', '20'))
+DEFAULT_MAX_RETRIES: Final[int] = 3
+DEFAULT_BATCH_CONCURRENCY: Final[int] = 8
+DEFAULT_BACKOFF_BASE: Final[float] = 0.5
+DEFAULT_BACKOFF_CAP: Final[float] = 8.0
+# Discord drops an interaction that is not answered within 3 seconds, so interactive reads give up a little earlier.
+DEFAULT_INTERACTIVE_DEADLINE: Final[float] = 2.5
+
+logger = logging.getLogger(__name__)
+
+# Failures after which a stale cached response is better than none at all.
+UPSTREAM_ERRORS: Final[tuple[type[BaseException], ...]] = (
+    OWMHTTPError, RateLimited, aiohttp.ClientError, asyncio.TimeoutError)
 
 
 class OWM:
@@ -111,127 +40,288 @@ class OWM:
     OPEN_WEATHER_ICON_WITH_TEXT_URL: Final[
         str] = 'https://openweathermap.org/themes/openweathermap/assets/img/logo_white_cropped.png'
 
-    def __init__(self, api_key: str = OWM_API_KEY):
+    def __init__(self, api_key: str = OWM_API_KEY, pool: Optional[SessionPool] = None,
+                 cache: Optional[ResponseCache] = None, base_url: str = OWM_BASE_URL,
+                 limiter: Optional[RateLimiter] = None, max_retries: int = DEFAULT_MAX_RETRIES,
+                 snapshots: Optional[SnapshotStore] = None, group_size: int = OWM_GROUP_SIZE,
+                 batch_concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+                 interactive_deadline: float = DEFAULT_INTERACTIVE_DEADLINE):
         self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.pool = pool if pool is not None else SessionPool()
+        self.cache = cache if cache is not None else ResponseCache()
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.max_retries = max_retries
+        self.interactive_deadline = interactive_deadline
+        self.snapshots = snapshots
+        self._restored: set[tuple] = set()
+        self.group_size = group_size
+        self.batch_concurrency = batch_concurrency
+        # OWM city id per quantized location, learnt from earlier responses; /group only takes ids.
+        self._city_ids: dict[tuple[float, float], int] = {}
+        self.single_flight = SingleFlight()
+        # Called with (endpoint, lat, lon) on every interactive read, e.g. to keep that location warm.
+        self.observers: list[Callable[[str, float, float], None]] = []
+        # Refreshes that outlive the read that started them.
+        self._background: set[asyncio.Task] = set()
+
+    async def close(self):
+        for task in list(self._background):
+            task.cancel()
+        await self.pool.close()
+        if self.snapshots is not None:
+            await self.snapshots.close()
+
+    def collect_metrics(self) -> list[tuple[str, dict[str, str], float]]:
+        return [('owm_pool_' + name, {}, value) for name, value in self.pool.stats.as_dict().items()] + \
+            [('owm_cache_' + name, {}, value) for name, value in self.cache.stats.as_dict().items()] + \
+            [('owm_cache_entries', {}, len(self.cache)),
+             ('owm_single_flight_coalesced', {}, self.single_flight.stats.coalesced)] + \
+            [('owm_limiter_' + name, {'priority': priority.name.lower()}, counts[priority])
+             for name, counts in (('waiting', self.limiter.waiting), ('granted', self.limiter.granted),
+                                  ('rejected', self.limiter.rejected))
+             for priority in Priority]
+
+    @staticmethod
+    def _backoff(attempt: int, error: BaseException) -> float:
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after is not None:
+            return retry_after
+        # Full jitter keeps retries from many callers from arriving in lockstep.
+        return random.uniform(0.0, min(DEFAULT_BACKOFF_CAP, DEFAULT_BACKOFF_BASE * 2 ** attempt))
+
+    async def _request(self, path: str, params: dict[str, Any], priority: Priority,
+                       ticket: Optional[Ticket] = None) -> dict[str, Any]:
+        params = dict(params, appid=self.api_key, units='metric', lang='ja')
+        # One ticket across the retries, so a raised priority holds for all of them.
+        ticket = ticket if ticket is not None else Ticket(priority=priority)
+        attempt = 0
+        while True:
+            await self.limiter.acquire(ticket=ticket)
+            try:
+                return await self.pool.get_json(url='{0}{1}'.format(self.base_url, path), params=params)
+            except (OWMHTTPError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+                if isinstance(error, OWMHTTPError):
+                    if not error.retryable:
+                        raise
+                    if error.status == 429:
+                        self.limiter.penalize(retry_after=error.retry_after or 60.0)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt=attempt, error=error)
+                logger.warning('OWM request %s failed (%r), retrying in %.1fs', path, error, delay)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def _stale(self, endpoint: str, lat: float, lon: float, error: BaseException) -> Any:
+        value = self.cache.get_stale(endpoint=endpoint, lat=lat, lon=lon)
+        if value is None:
+            raise error
+        logger.warning('serving stale %s for (%s, %s): %r', endpoint, lat, lon, error)
+        return value
+
+    def _in_background(self, awaitable: Awaitable[Any]) -> asyncio.Task:
+        task = asyncio.ensure_future(awaitable)
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+        return task
+
+    def _background_done(self, task: asyncio.Task):
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning('background OWM refresh failed: %r', task.exception())
+
+    def _observe(self, endpoint: str, lat: float, lon: float):
+        for observer in self.observers:
+            observer(endpoint, lat, lon)
+
+    async def restore(self, endpoint: str, lat: float, lon: float) -> bool:
+        # Loads the snapshot saved by an earlier process into the cache, once per location; True if it is fresh.
+        key = self.cache.key(endpoint=endpoint, lat=lat, lon=lon)
+        if self.snapshots is None or key in self._restored:
+            return False
+        self._restored.add(key)
+        row = await self.snapshots.get(endpoint=endpoint, lat=key[1], lon=key[2])
+        if row is None:
+            return False
+        age, data = row
+        ttl = self.cache.ttls[endpoint]
+        if age >= ttl + self.cache.stale_ttl or self.cache.expires_at(endpoint=endpoint, lat=lat, lon=lon) is not None:
+            return False
+        decoder = forecast_decoder() if endpoint == FORECAST else current_weather_decoder()
+        value = decoder.decode(data=data)
+        self._remember_city(lat=lat, lon=lon, value=value)
+        self.cache.put(endpoint=endpoint, lat=lat, lon=lon, value=value, age=age)
+        return age < ttl
+
+    def _remember_city(self, lat: float, lon: float, value: Any):
+        city = value.city if isinstance(value, Weather) else value.weathers[0].city if value.weathers else None
+        if city is not None and city.id is not None:
+            self._city_ids[self.cache.key(endpoint=CURRENT_WEATHER, lat=lat, lon=lon)[1:]] = city.id
+
+    async def _get(self, endpoint: str, lat: float, lon: float, priority: Priority) -> Any:
+        if priority == Priority.INTERACTIVE:
+            self._observe(endpoint=endpoint, lat=lat, lon=lon)
+        return await self._load(endpoint=endpoint, lat=lat, lon=lon, priority=priority)
+
+    async def _load(self, endpoint: str, lat: float, lon: float, priority: Priority) -> Any:
+        value = self.cache.get(endpoint=endpoint, lat=lat, lon=lon)
+        if value is None and await self.restore(endpoint=endpoint, lat=lat, lon=lon):
+            value = self.cache.get(endpoint=endpoint, lat=lat, lon=lon)
+        if value is not None:
+            return value
+        if priority == Priority.INTERACTIVE:
+            return await self._load_interactive(endpoint=endpoint, lat=lat, lon=lon)
+        try:
+            return await self.refresh(endpoint=endpoint, lat=lat, lon=lon, priority=priority)
+        except UPSTREAM_ERRORS as error:
+            return self._stale(endpoint=endpoint, lat=lat, lon=lon, error=error)
 
-    def _fix_dict(self, temp: dict, data: dict):
-        fixed: dict[Union[dict, list, str, float, int]] = {}
-        for key in temp:
-            if key in data:
-                if type(temp[key]) == dict and type(data[key]):
-                    fixed[key] = self._fix_dict(temp=temp[key], data=data[key])
-                elif type(temp[key]) == list and type(data[key]):
-                    fixed[key] = self._fix_list(temp=temp[key], data=data[key])
-                else:
-                    fixed[key] = data[key]
+    async def _load_interactive(self, endpoint: str, lat: float, lon: float) -> Any:
+        # Someone is waiting on a Discord interaction, so retries and limiter waits must not hold up the answer: a
+        # stale value is returned at once and refreshed behind it, and without one the fetch gets
+        # interactive_deadline, after which it carries on in the background for the next read.
+        value = self.cache.get_stale(endpoint=endpoint, lat=lat, lon=lon)
+        if value is not None:
+            self._in_background(self.refresh(endpoint=endpoint, lat=lat, lon=lon, priority=Priority.BACKGROUND))
+            return value
+        fetch = self._in_background(self.refresh(endpoint=endpoint, lat=lat, lon=lon, priority=Priority.INTERACTIVE))
+        return await asyncio.wait_for(asyncio.shield(fetch), timeout=self.interactive_deadline)
+
+    @METRICS.timed('owm_call', endpoint=CURRENT_WEATHER)
+    async def get_current_weather(self, lat: float, lon: float, priority: Priority = Priority.INTERACTIVE) -> Weather:
+        return await self._get(endpoint=CURRENT_WEATHER, lat=lat, lon=lon, priority=priority)
+
+    @METRICS.timed('owm_call', endpoint=FORECAST)
+    async def get_forecast(self, lat: float, lon: float, priority: Priority = Priority.INTERACTIVE) -> Forecast:
+        return await self._get(endpoint=FORECAST, lat=lat, lon=lon, priority=priority)
+
+    def _save(self, endpoint: str, lat: float, lon: float, data: dict[str, Any]):
+        if self.snapshots is not None:
+            key = self.cache.key(endpoint=endpoint, lat=lat, lon=lon)
+            self.snapshots.save(endpoint=endpoint, lat=key[1], lon=key[2], data=data)
+
+    @METRICS.timed('owm_upstream', endpoint=CURRENT_WEATHER)
+    async def _fetch_current_weather(self, lat: float, lon: float, priority: Priority = Priority.INTERACTIVE,
+                                     ticket: Optional[Ticket] = None) -> Weather:
+        data = await self._request(path='/data/2.5/weather', params={'lat': lat, 'lon': lon}, priority=priority,
+                                   ticket=ticket)
+        weather = current_weather_decoder().decode(data=data)
+        self._remember_city(lat=lat, lon=lon, value=weather)
+        self.cache.put(endpoint=CURRENT_WEATHER, lat=lat, lon=lon, value=weather)
+        self._save(endpoint=CURRENT_WEATHER, lat=lat, lon=lon, data=data)
+        return weather
+
+    @METRICS.timed('owm_upstream', endpoint=FORECAST)
+    async def _fetch_forecast(self, lat: float, lon: float, priority: Priority = Priority.INTERACTIVE,
+                              ticket: Optional[Ticket] = None) -> Forecast:
+        data = await self._request(path='/data/2.5/forecast', params={'lat': lat, 'lon': lon}, priority=priority,
+                                   ticket=ticket)
+        forecast = forecast_decoder().decode(data=data)
+        self._remember_city(lat=lat, lon=lon, value=forecast)
+        self.cache.put(endpoint=FORECAST, lat=lat, lon=lon, value=forecast)
+        self._save(endpoint=FORECAST, lat=lat, lon=lon, data=data)
+        return forecast
+
+    async def refresh(self, endpoint: str, lat: float, lon: float,
+                      priority: Priority = Priority.BACKGROUND) -> Any:
+        # Fetches regardless of what is cached, sharing the upstream call with any reader already waiting on it.
+        fetch = self._fetch_forecast if endpoint == FORECAST else self._fetch_current_weather
+        ticket = Ticket(priority=priority)
+        return await self.single_flight.do(
+            key=self.cache.key(endpoint=endpoint, lat=lat, lon=lon),
+            function=functools.partial(fetch, lat=lat, lon=lon, priority=priority, ticket=ticket), ticket=ticket
+        )
+
+    @METRICS.timed('owm_upstream', endpoint='group')
+    async def _fetch_group(self, city_ids: list[int], priority: Priority) -> dict[int, dict[str, Any]]:
+        data = await self._request(path='/data/2.5/group', params={'id': ','.join(map(str, city_ids))},
+                                   priority=priority)
+        return {entry.get('id'): entry for entry in group_entries(data=data)}
+
+    async def _fetch_groups(self, locations: list[tuple[float, float]], priority: Priority,
+                            results: dict[tuple[float, float], Weather]) -> list[tuple[float, float]]:
+        # Fills results for the locations whose city is known and returns the ones left for single requests.
+        remaining = []
+        by_city: dict[int, list[tuple[float, float]]] = {}
+        for lat, lon in locations:
+            city_id = self._city_ids.get(self.cache.key(endpoint=CURRENT_WEATHER, lat=lat, lon=lon)[1:])
+            if city_id is None:
+                remaining.append((lat, lon))
             else:
-                fixed[key] = temp[key]
-        return fixed
-
-    def _fix_list(self, temp: list, data: list):
-        fixed = []
-        for datum in data:
-            if type(temp[0]) == dict and type(datum) == dict:
-                fixed.append(self._fix_dict(temp=temp[0], data=datum))
-            elif type(temp[0]) == list and type(datum) == list:
-                fixed.append(self._fix_list(temp=temp, data=datum))
+                by_city.setdefault(city_id, []).append((lat, lon))
+        city_ids = list(by_city)
+        chunks = [city_ids[start:start + self.group_size] for start in range(0, len(city_ids), self.group_size)]
+        responses = await asyncio.gather(*[self._fetch_group(city_ids=chunk, priority=priority) for chunk in chunks],
+                                         return_exceptions=True)
+        for chunk, response in zip(chunks, responses):
+            if isinstance(response, BaseException):
+                if isinstance(response, OWMHTTPError) and not response.retryable:
+                    # The plan does not offer /group; stop trying it.
+                    logger.warning('OWM /group unavailable (%r), falling back to single requests', response)
+                    self.group_size = 0
+                elif not isinstance(response, UPSTREAM_ERRORS):
+                    raise response
+                remaining.extend(location for city_id in chunk for location in by_city[city_id])
+                continue
+            for city_id in chunk:
+                entry = response.get(city_id)
+                if entry is None:
+                    remaining.extend(by_city[city_id])
+                    continue
+                weather = current_weather_decoder().decode(data=entry)
+                for lat, lon in by_city[city_id]:
+                    self.cache.put(endpoint=CURRENT_WEATHER, lat=lat, lon=lon, value=weather)
+                    self._save(endpoint=CURRENT_WEATHER, lat=lat, lon=lon, data=entry)
+                    results[(lat, lon)] = weather
+        return remaining
+
+    async def _get_many(self, endpoint: str, locations: Iterable[tuple[float, float]], priority: Priority,
+                        results: dict[tuple[float, float], Any]):
+        locations = list(dict.fromkeys(locations))
+        if priority == Priority.INTERACTIVE:
+            for lat, lon in locations:
+                self._observe(endpoint=endpoint, lat=lat, lon=lon)
+        missing = []
+        for lat, lon in locations:
+            value = self.cache.get(endpoint=endpoint, lat=lat, lon=lon)
+            if value is None:
+                missing.append((lat, lon))
             else:
-                fixed.append(datum)
-        return fixed
-
-    async def get_current_weather(self, lat: float, lon: float):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                    url='https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric&lang=ja'.format(
-                        lat=lat, lon=lon, api_key=self.api_key)
-            ) as response:
-                data = await response.json()
-        data = self._fix_dict(temp=CURRENT_WEATHER_DATA_TEMPLATE, data=data)
-        return Weather(
-            city=Weather.City(
-                lat=data['coord']['lat'], lon=data['coord']['lon'],
-                name=data['name'], country=data['sys']['country'],
-                sunrise=datetime.datetime.fromtimestamp(data['sys']['sunrise'], tz=ZONE_TOKYO),
-                sunset=datetime.datetime.fromtimestamp(data['sys']['sunset'], tz=ZONE_TOKYO)
-            ),
-            conditions=[Weather.Condition(
-                id=_weather['id'], main=_weather['main'],
-                description=_weather['description'], icon=_weather['icon']) for _weather in data['weather']],
-            main=Weather.Main(
-                temperature=data['main']['temp'], feels_like=data['main']['feels_like'],
-                pressure=data['main']['pressure'], humidity=data['main']['humidity'],
-                temperature_max=data['main']['temp_max'], temperature_min=data['main']['temp_min'],
-                sea_level=data['main']['sea_level'], ground_level=data['main']['grnd_level']
-            ),
-            visibility=data['visibility'],
-            wind=Weather.Wind(
-                speed=data['wind']['speed'],
-                degrees=data['wind']['deg'],
-                gust=data['wind']['gust']
-            ),
-            clouds=Weather.Clouds(
-                cloudiness=data['clouds']['all']
-            ),
-            rain=Weather.Rain(
-                an_hour=data['rain']['1h'],
-                three_hour=data['rain']['3h']
-            ),
-            snow=Weather.Snow(
-                an_hour=data['snow']['1h'],
-                three_hour=data['snow']['3h']
-            ),
-            time=datetime.datetime.fromtimestamp(data['dt'], tz=ZONE_TOKYO),
-            timezone=datetime.timezone(offset=datetime.timedelta(seconds=data['timezone'])),
-            probability=None
-        )
+                results[(lat, lon)] = value
+        if endpoint == CURRENT_WEATHER and self.group_size > 0 and missing:
+            missing = await self._fetch_groups(locations=missing, priority=priority, results=results)
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
 
-    async def get_forecast(self, lat: float, lon: float) -> Forecast:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                    url='https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={api_key}&units=metric&lang=ja'.format(
-                        lat=lat, lon=lon, api_key=self.api_key
-                    )) as response:
-                data = await response.json()
-        data = self._fix_dict(temp=FORECAST_DATA_TEMPLATE, data=data)
-        return Forecast(
-            weathers=[Weather(
-                city=Weather.City(
-                    lat=data['city']['coord']['lat'], lon=data['city']['coord']['lon'],
-                    name=data['city']['name'], country=data['city']['country'],
-                    sunrise=datetime.datetime.fromtimestamp(data['city']['sunrise'], tz=ZONE_TOKYO),
-                    sunset=datetime.datetime.fromtimestamp(data['city']['sunset'], tz=ZONE_TOKYO)
-                ),
-                conditions=[Weather.Condition(
-                    id=_weather['id'], main=_weather['main'],
-                    description=_weather['description'], icon=_weather['icon']) for _weather in datum['weather']],
-                main=Weather.Main(
-                    temperature=datum['main']['temp'], feels_like=datum['main']['feels_like'],
-                    pressure=datum['main']['pressure'], humidity=datum['main']['humidity'],
-                    temperature_max=datum['main']['temp_max'], temperature_min=datum['main']['temp_min'],
-                    sea_level=datum['main']['sea_level'], ground_level=datum['main']['grnd_level']
-                ),
-                visibility=datum['visibility'],
-                wind=Weather.Wind(
-                    speed=datum['wind']['speed'],
-                    degrees=datum['wind']['deg'],
-                    gust=datum['wind']['gust']
-                ),
-                clouds=Weather.Clouds(
-                    cloudiness=datum['clouds']['all']
-                ),
-                rain=Weather.Rain(
-                    an_hour=None,
-                    three_hour=datum['rain']['3h']
-                ),
-                snow=Weather.Snow(
-                    an_hour=None,
-                    three_hour=datum['snow']['3h']
-                ),
-                time=datetime.datetime.fromtimestamp(datum['dt'], tz=ZONE_TOKYO),
-                timezone=datetime.timezone(offset=datetime.timedelta(seconds=data['city']['timezone'])),
-                probability=datum['pop']
-            ) for datum in data['list']]
-        )
+        async def load(lat: float, lon: float) -> Any:
+            async with semaphore:
+                return await self._load(endpoint=endpoint, lat=lat, lon=lon, priority=priority)
+
+        values = await asyncio.gather(*[load(lat=lat, lon=lon) for lat, lon in missing], return_exceptions=True)
+        for location, value in zip(missing, values):
+            if isinstance(value, BaseException):
+                if not isinstance(value, UPSTREAM_ERRORS):
+                    raise value
+                # Left out of the results; callers treat a missing key as a failed location.
+                logger.error('failed to fetch %s for %s: %r', endpoint, location, value)
+                continue
+            results[location] = value
+
+    @METRICS.timed('owm_batch', endpoint=CURRENT_WEATHER)
+    async def get_current_weather_many(self, locations: Iterable[tuple[float, float]],
+                                       priority: Priority = Priority.INTERACTIVE) -> dict[tuple[float, float], Weather]:
+        # Locations whose city is already known go out 20 to a /group request, the rest as bounded single requests.
+        results: dict[tuple[float, float], Weather] = {}
+        await self._get_many(endpoint=CURRENT_WEATHER, locations=locations, priority=priority, results=results)
+        return results
+
+    @METRICS.timed('owm_batch', endpoint=FORECAST)
+    async def get_forecast_many(self, locations: Iterable[tuple[float, float]],
+                                priority: Priority = Priority.INTERACTIVE) -> dict[tuple[float, float], Forecast]:
+        # OWM has no multi-location forecast endpoint, so these are always bounded single requests.
+        results: dict[tuple[float, float], Forecast] = {}
+        await self._get_many(endpoint=FORECAST, locations=locations, priority=priority, results=results)
+        return results
 
     async def get_weather_map(self):
         pass
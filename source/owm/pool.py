@@ -0,0 +1,121 @@
+import asyncio
+import types
+from typing import Final, Optional
+
+import aiohttp
+
+DEFAULT_LIMIT: Final[int] = 100
+DEFAULT_LIMIT_PER_HOST: Final[int] = 20
+DEFAULT_KEEPALIVE_TIMEOUT: Final[float] = 60.0
+DEFAULT_TOTAL_TIMEOUT: Final[float] = 10.0
+DEFAULT_CONNECT_TIMEOUT: Final[float] = 5.0
+
+
+class OWMHTTPError(Exception):
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None):
+        super().__init__('OWM responded {0}: {1}'.format(status, message))
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status == 429 or self.status >= 500
+
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class PoolStats:
+    def __init__(self):
+        self.requests = 0
+        self.in_flight = 0
+        self.errors = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    @property
+    def reuse_ratio(self) -> float:
+        acquired = self.connections_created + self.connections_reused
+        return self.connections_reused / acquired if acquired else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            'requests': self.requests,
+            'in_flight': self.in_flight,
+            'errors': self.errors,
+            'connections_created': self.connections_created,
+            'connections_reused': self.connections_reused,
+            'reuse_ratio': self.reuse_ratio
+        }
+
+
+class SessionPool:
+    def __init__(self, limit: int = DEFAULT_LIMIT, limit_per_host: int = DEFAULT_LIMIT_PER_HOST,
+                 keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT, total_timeout: float = DEFAULT_TOTAL_TIMEOUT,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self.stats = PoolStats()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def closed(self) -> bool:
+        return self._session is None or self._session.closed
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+        return trace_config
+
+    async def _on_connection_create_end(self, session: aiohttp.ClientSession, context: types.SimpleNamespace,
+                                        params: aiohttp.TraceConnectionCreateEndParams):
+        self.stats.connections_created += 1
+
+    async def _on_connection_reuseconn(self, session: aiohttp.ClientSession, context: types.SimpleNamespace,
+                                       params: aiohttp.TraceConnectionReuseconnParams):
+        self.stats.connections_reused += 1
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        # The session has to be created inside the running loop, so it is built on first use.
+        if self.closed:
+            async with self._lock:
+                if self.closed:
+                    self._session = aiohttp.ClientSession(
+                        connector=aiohttp.TCPConnector(
+                            limit=self.limit, limit_per_host=self.limit_per_host,
+                            keepalive_timeout=self.keepalive_timeout, ttl_dns_cache=300
+                        ),
+                        timeout=self.timeout,
+                        trace_configs=[self._trace_config()]
+                    )
+        return self._session
+
+    async def get_json(self, url: str, params: Optional[dict] = None) -> dict:
+        session = await self.get_session()
+        self.stats.requests += 1
+        self.stats.in_flight += 1
+        try:
+            async with session.get(url=url, params=params) as response:
+                if response.status >= 400:
+                    raise OWMHTTPError(status=response.status, message=await response.text(),
+                                       retry_after=_retry_after(response.headers.get('Retry-After')))
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, OWMHTTPError):
+            self.stats.errors += 1
+            raise
+        finally:
+            self.stats.in_flight -= 1
+
+    async def close(self):
+        if not self.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,168 @@
+import asyncio
+import collections
+import logging
+from typing import Callable, Final, Iterable, Optional
+
+from .cache import CURRENT_WEATHER, FORECAST
+from .openweathermap import OWM, UPSTREAM_ERRORS
+from .ratelimit import Priority
+
+# Refresh this long before an entry expires, so readers never see the gap.
+DEFAULT_LEAD: Final[float] = 60.0
+# Scheduled targets (subscriptions) are refreshed once, within this long before they are needed.
+DEFAULT_AHEAD: Final[float] = 120.0
+# Unpinned locations nobody has asked for in this long are no longer refreshed.
+DEFAULT_IDLE_TIMEOUT: Final[float] = 60 * 60.0
+DEFAULT_INTERVAL: Final[float] = 15.0
+DEFAULT_MAX_LOCATIONS: Final[int] = 256
+DEFAULT_CONCURRENCY: Final[int] = 4
+
+logger = logging.getLogger(__name__)
+
+Target = tuple[str, float, float]
+# Seconds until the target is needed, and the target.
+Upcoming = tuple[float, Target]
+
+
+class PrefetchStats:
+    def __init__(self):
+        self.refreshes = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'dropped': self.dropped
+        }
+
+
+class Prefetcher:
+    def __init__(self, owm: OWM, lead: float = DEFAULT_LEAD, idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 interval: float = DEFAULT_INTERVAL, max_locations: int = DEFAULT_MAX_LOCATIONS,
+                 concurrency: int = DEFAULT_CONCURRENCY,
+                 upcoming: Optional[Callable[[float], Iterable[Upcoming]]] = None, ahead: float = DEFAULT_AHEAD):
+        self.owm = owm
+        self.lead = lead
+        self.idle_timeout = idle_timeout
+        self.interval = interval
+        self.max_locations = max_locations
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # Called with ahead, returning the scheduled targets needed within that many seconds.
+        self.upcoming = upcoming
+        self.ahead = ahead
+        self.stats = PrefetchStats()
+        # Keyed by the cache key so nearby coordinates share one refresh; the values keep the original coordinates.
+        self._pinned: dict[tuple, tuple[int, Target]] = {}
+        self._hot: collections.OrderedDict[tuple, tuple[float, Target]] = collections.OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._pinned) + sum(1 for key in self._hot if key not in self._pinned)
+
+    def _key(self, endpoint: str, lat: float, lon: float) -> tuple:
+        return self.owm.cache.key(endpoint=endpoint, lat=lat, lon=lon)
+
+    def pin(self, endpoint: str, lat: float, lon: float):
+        # Pinned targets (the default location) are kept warm however rarely they are read.
+        key = self._key(endpoint=endpoint, lat=lat, lon=lon)
+        count, target = self._pinned.get(key, (0, (endpoint, lat, lon)))
+        self._pinned[key] = (count + 1, target)
+
+    def unpin(self, endpoint: str, lat: float, lon: float):
+        key = self._key(endpoint=endpoint, lat=lat, lon=lon)
+        count, target = self._pinned.get(key, (0, None))
+        if count > 1:
+            self._pinned[key] = (count - 1, target)
+        else:
+            self._pinned.pop(key, None)
+
+    def sync(self, targets: Iterable[Target]):
+        self._pinned.clear()
+        for endpoint, lat, lon in targets:
+            self.pin(endpoint=endpoint, lat=lat, lon=lon)
+
+    def touch(self, endpoint: str, lat: float, lon: float):
+        # Registered as an OWM observer: every interactive read makes its location hot again.
+        key = self._key(endpoint=endpoint, lat=lat, lon=lon)
+        self._hot[key] = (self.owm.cache.clock(), (endpoint, lat, lon))
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.max_locations:
+            self._hot.popitem(last=False)
+            self.stats.dropped += 1
+
+    def _drop_cold(self, now: float):
+        while self._hot:
+            key, (touched_at, _) = next(iter(self._hot.items()))
+            if touched_at + self.idle_timeout > now:
+                break
+            del self._hot[key]
+            self.stats.dropped += 1
+
+    def due(self) -> list[Target]:
+        now = self.owm.cache.clock()
+        self._drop_cold(now=now)
+        targets = {key: target for key, (_, target) in self._hot.items()}
+        targets.update((key, target) for key, (_, target) in self._pinned.items())
+        due = {}
+        for key, (endpoint, lat, lon) in targets.items():
+            expires_at = self.owm.cache.expires_at(endpoint=endpoint, lat=lat, lon=lon)
+            if expires_at is None or expires_at - self.lead <= now:
+                due[key] = (endpoint, lat, lon)
+        if self.upcoming is not None:
+            # A scheduled target only has to stay fresh until it is needed, so it costs one refresh per use rather
+            # than one per TTL around the clock.
+            for seconds, (endpoint, lat, lon) in self.upcoming(self.ahead):
+                key = self._key(endpoint=endpoint, lat=lat, lon=lon)
+                if key in due:
+                    continue
+                expires_at = self.owm.cache.expires_at(endpoint=endpoint, lat=lat, lon=lon)
+                if expires_at is None or expires_at - self.lead <= now + max(seconds, 0.0):
+                    due[key] = (endpoint, lat, lon)
+        return list(due.values())
+
+    async def _refresh(self, endpoint: str, lat: float, lon: float):
+        async with self.semaphore:
+            try:
+                if await self.owm.restore(endpoint=endpoint, lat=lat, lon=lon):
+                    # A fresh snapshot from before the restart; the next pass refreshes it when it nears expiry.
+                    return
+                await self.owm.refresh(endpoint=endpoint, lat=lat, lon=lon, priority=Priority.BACKGROUND)
+                self.stats.refreshes += 1
+            except UPSTREAM_ERRORS as error:
+                # Left for the next pass; the entry is served stale meanwhile.
+                self.stats.failures += 1
+                logger.warning('prefetch of %s for (%s, %s) failed: %r', endpoint, lat, lon, error)
+
+    async def refresh_due(self) -> int:
+        due = self.due()
+        await asyncio.gather(*[self._refresh(endpoint=endpoint, lat=lat, lon=lon) for endpoint, lat, lon in due])
+        return len(due)
+
+    def collect_metrics(self) -> list[tuple[str, dict[str, str], float]]:
+        return [('prefetch_' + name, {}, value) for name, value in self.stats.as_dict().items()] + \
+            [('prefetch_pinned', {}, len(self._pinned)), ('prefetch_hot', {}, len(self._hot))]
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self.owm.observers.append(self.touch)
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self.owm.observers.remove(self.touch)
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh_due()
+            except Exception:
+                logger.exception('prefetch pass failed')
+            await asyncio.sleep(self.interval)
+
+
+def subscription_target(is_forecast: bool, lat: float, lon: float) -> Target:
+    return (FORECAST if is_forecast else CURRENT_WEATHER), lat, lon
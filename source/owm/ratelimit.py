@@ -0,0 +1,113 @@
+import asyncio
+import enum
+import os
+import time
+from typing import Callable, Final, Optional
+
+# OpenWeatherMap's free plan: 60 calls/minute and 1,000,000 calls/month.
+CALLS_PER_MINUTE: Final[float] = float(os.getenv('OWM_CALLS_PER_MINUTE', '60'))
+CALLS_PER_DAY: Final[float] = float(os.getenv('OWM_CALLS_PER_DAY', str(1_000_000 // 31)))
+# Share of each budget that only interactive requests may spend.
+DEFAULT_RESERVE: Final[float] = 0.2
+DEFAULT_MAX_WAIT: Final[float] = 30.0
+
+
+class Priority(enum.IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class Ticket:
+    # The priority one request waits in the limiter with. It can be raised while the request waits, for example when
+    # an interactive reader joins a fetch the prefetcher started, so the reader does not queue behind the background
+    # reserve.
+    def __init__(self, priority: Priority = Priority.INTERACTIVE):
+        self.priority = priority
+        self.raised = asyncio.Event()
+
+    def raise_to(self, priority: Priority):
+        if priority < self.priority:
+            self.priority = priority
+            self.raised.set()
+
+
+class RateLimited(Exception):
+    def __init__(self, priority: Priority, wait: float):
+        super().__init__('OWM call budget exhausted for {0} requests, next slot in {1:.1f}s'.format(
+            priority.name.lower(), wait))
+        self.priority = priority
+        self.wait = wait
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, period: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, tokens: float) -> float:
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    def __init__(self, calls_per_minute: float = CALLS_PER_MINUTE, calls_per_day: float = CALLS_PER_DAY,
+                 reserve: float = DEFAULT_RESERVE, max_wait: float = DEFAULT_MAX_WAIT,
+                 clock: Callable[[], float] = time.monotonic, processes: int = 1):
+        # The plan is per API key: each of the processes sharing the key keeps to its share of it.
+        self.minute = TokenBucket(capacity=calls_per_minute / processes, period=60.0, clock=clock)
+        self.day = TokenBucket(capacity=calls_per_day / processes, period=24 * 60 * 60.0, clock=clock)
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.waiting = {priority: 0 for priority in Priority}
+        self.granted = {priority: 0 for priority in Priority}
+        self.rejected = {priority: 0 for priority in Priority}
+
+    def _needed(self, bucket: TokenBucket, priority: Priority) -> float:
+        # Background requests leave the reserved share of each bucket to interactive ones.
+        return 1.0 if priority == Priority.INTERACTIVE else 1.0 + bucket.capacity * self.reserve
+
+    def _wait(self, priority: Priority) -> float:
+        self.minute.refill()
+        self.day.refill()
+        wait = max(self.minute.wait_for(self._needed(self.minute, priority)),
+                   self.day.wait_for(self._needed(self.day, priority)))
+        if wait == 0.0 and priority == Priority.BACKGROUND and self.waiting[Priority.INTERACTIVE]:
+            # Let queued interactive requests go first.
+            wait = 1.0 / self.minute.rate
+        return wait
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE, ticket: Optional[Ticket] = None):
+        ticket = ticket if ticket is not None else Ticket(priority=priority)
+        deadline = self.minute.clock() + self.max_wait
+        while True:
+            # Read on every pass, as the ticket may have been raised while this request slept.
+            priority = ticket.priority
+            wait = self._wait(priority=priority)
+            if wait == 0.0:
+                self.minute.tokens -= 1.0
+                self.day.tokens -= 1.0
+                self.granted[priority] += 1
+                return
+            if self.minute.clock() + wait > deadline:
+                self.rejected[priority] += 1
+                raise RateLimited(priority=priority, wait=wait)
+            self.waiting[priority] += 1
+            try:
+                await asyncio.wait_for(ticket.raised.wait(), timeout=wait)
+                ticket.raised.clear()
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self.waiting[priority] -= 1
+
+    def penalize(self, retry_after: float):
+        # The server said slow down: treat the minute budget as spent until Retry-After has passed.
+        self.minute.refill()
+        self.minute.tokens = min(self.minute.tokens, -retry_after * self.minute.rate)
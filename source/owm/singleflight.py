@@ -0,0 +1,69 @@
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from .ratelimit import Ticket
+
+
+class SingleFlightStats:
+    def __init__(self):
+        self.calls = 0
+        self.executions = 0
+
+    @property
+    def coalesced(self) -> int:
+        return self.calls - self.executions
+
+    def as_dict(self) -> dict[str, int]:
+        return {'calls': self.calls, 'executions': self.executions, 'coalesced': self.coalesced}
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task, ticket: Optional[Ticket]):
+        self.task = task
+        self.ticket = ticket
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self.stats = SingleFlightStats()
+        self._calls: dict[Hashable, _Call] = {}
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[Any]], ticket: Optional[Ticket] = None) -> Any:
+        # ticket is the one function waits in the rate limiter with; a more urgent caller joining raises it, so the
+        # shared call is not held to the priority of whoever started it.
+        self.stats.calls += 1
+        call = self._calls.get(key)
+        if call is None:
+            self.stats.executions += 1
+            call = _Call(task=asyncio.ensure_future(function()), ticket=ticket)
+            self._calls[key] = call
+            call.task.add_done_callback(functools.partial(self._forget, key, call))
+        elif ticket is not None and call.ticket is not None:
+            call.ticket.raise_to(priority=ticket.priority)
+        call.waiters += 1
+        try:
+            # Shielded so that one caller giving up does not cancel the fetch for everyone else.
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                # The last waiter left: nobody needs the result any more.
+                self._discard(key=key, call=call)
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _discard(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def _forget(self, key: Hashable, call: _Call, task: asyncio.Task):
+        self._discard(key=key, call=call)
+        if not task.cancelled():
+            # Retrieve the exception so an unobserved failure is not logged as "never retrieved".
+            task.exception()
@@ -0,0 +1,90 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from typing import Any, Callable, Final, Optional
+
+# Empty disables the store; the bot then starts with an empty cache as before.
+SNAPSHOT_PATH: Final[str] = os.getenv('OWM_SNAPSHOT_PATH', 'owm_snapshots.sqlite3')
+# Rows older than this are deleted when the store is opened; they are too old to serve even as stale data.
+DEFAULT_MAX_AGE: Final[float] = 24 * 60 * 60.0
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotStore:
+    # Raw OWM payloads, zlib-compressed JSON keyed by (endpoint, quantized lat, lon), kept across restarts.
+    def __init__(self, path: str = SNAPSHOT_PATH, max_age: float = DEFAULT_MAX_AGE,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.max_age = max_age
+        self.clock = clock
+        # One thread owns the connection, which also serializes writes.
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='weather-snapshot')
+        self._connection: Optional[sqlite3.Connection] = None
+
+    async def _run(self, function: Callable[..., Any], *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS snapshots ('
+                'endpoint TEXT NOT NULL, lat REAL NOT NULL, lon REAL NOT NULL, '
+                'fetched_at REAL NOT NULL, payload BLOB NOT NULL, '
+                'PRIMARY KEY (endpoint, lat, lon)) WITHOUT ROWID')
+            connection.execute('DELETE FROM snapshots WHERE fetched_at < ?', (self.clock() - self.max_age,))
+            self._connection = connection
+        return self._connection
+
+    def _get(self, endpoint: str, lat: float, lon: float) -> Optional[tuple[float, dict]]:
+        row = self._connect().execute(
+            'SELECT fetched_at, payload FROM snapshots WHERE endpoint = ? AND lat = ? AND lon = ?',
+            (endpoint, lat, lon)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(zlib.decompress(row[1]))
+
+    def _put(self, endpoint: str, lat: float, lon: float, fetched_at: float, payload: bytes):
+        self._connect().execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?)',
+                                (endpoint, lat, lon, fetched_at, payload))
+
+    async def get(self, endpoint: str, lat: float, lon: float) -> Optional[tuple[float, dict]]:
+        # Returns (age in seconds, payload) for the last response saved for this location.
+        try:
+            row = await self._run(self._get, endpoint, lat, lon)
+        except (sqlite3.Error, ValueError, zlib.error):
+            logger.exception('reading the %s snapshot for (%s, %s) failed', endpoint, lat, lon)
+            return None
+        if row is None:
+            return None
+        fetched_at, data = row
+        return max(0.0, self.clock() - fetched_at), data
+
+    def save(self, endpoint: str, lat: float, lon: float, data: dict):
+        # Queued without waiting, so replies never wait on the disk.
+        payload = zlib.compress(json.dumps(data, separators=(',', ':')).encode(), 1)
+        future = self.executor.submit(self._put, endpoint, lat, lon, self.clock(), payload)
+        future.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(future: concurrent.futures.Future):
+        if future.exception() is not None:
+            logger.error('saving an OWM snapshot failed', exc_info=future.exception())
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def close(self):
+        # Queued behind any pending saves, so a clean shutdown leaves the latest responses on disk.
+        await self._run(self._close)
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,114 @@
+import collections
+import sys
+import time
+import types
+from typing import Callable, Final, Generic, Hashable, Optional, TypeVar
+
+import discord
+
+from .owm.openweathermap import OWM
+
+# discord.ui.View's default timeout: after this the Runner's buttons stop working anyway.
+DEFAULT_IDLE_TIMEOUT: Final[float] = 180.0
+DEFAULT_MAX_RUNNERS: Final[int] = 256
+# Shared, long-lived objects that should not be counted against a single Runner.
+_SHARED_TYPES: Final[tuple[type, ...]] = (type, types.ModuleType, types.FunctionType, types.MethodType, OWM,
+                                           discord.Client, discord.Guild, discord.abc.Messageable)
+
+R = TypeVar('R')
+
+
+def estimate_size(obj: object, limit: int = 10000) -> int:
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack and len(seen) < limit:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _SHARED_TYPES):
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif hasattr(current, '__dict__'):
+            stack.append(vars(current))
+    return size
+
+
+class RegistryStats:
+    def __init__(self):
+        self.created = 0
+        self.reused = 0
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+
+
+class RunnerRegistry(Generic[R]):
+    def __init__(self, factory: Callable[[discord.abc.Messageable], R], max_runners: int = DEFAULT_MAX_RUNNERS,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT, per_user: bool = False,
+                 clock: Callable[[], float] = time.monotonic):
+        self.factory = factory
+        self.max_runners = max_runners
+        self.idle_timeout = idle_timeout
+        self.per_user = per_user
+        self.clock = clock
+        self.stats = RegistryStats()
+        self._runners: collections.OrderedDict[Hashable, tuple[float, R]] = collections.OrderedDict()
+        self._runner_size: Optional[int] = None
+
+    def __len__(self):
+        return len(self._runners)
+
+    def key(self, channel: discord.abc.Messageable, user: Optional[discord.abc.User] = None) -> Hashable:
+        return (channel.id, user.id) if self.per_user and user is not None else channel.id
+
+    def get(self, channel: discord.abc.Messageable, user: Optional[discord.abc.User] = None) -> R:
+        self.sweep()
+        key = self.key(channel=channel, user=user)
+        entry = self._runners.get(key)
+        if entry is None:
+            runner = self.factory(channel)
+            self.stats.created += 1
+            if self._runner_size is None:
+                # Runners are built from the same template, so one sample stands for all of them.
+                self._runner_size = estimate_size(runner)
+        else:
+            runner = entry[1]
+            self.stats.reused += 1
+        self._runners[key] = (self.clock(), runner)
+        self._runners.move_to_end(key)
+        while len(self._runners) > self.max_runners:
+            self._runners.popitem(last=False)
+            self.stats.evicted_lru += 1
+        return runner
+
+    def touch(self, channel: discord.abc.Messageable, user: Optional[discord.abc.User] = None):
+        key = self.key(channel=channel, user=user)
+        entry = self._runners.get(key)
+        if entry is not None:
+            self._runners[key] = (self.clock(), entry[1])
+            self._runners.move_to_end(key)
+
+    def sweep(self):
+        deadline = self.clock() - self.idle_timeout
+        # Oldest first, so the scan stops at the first Runner that is still in use.
+        while self._runners:
+            key, (last_used, _) = next(iter(self._runners.items()))
+            if last_used > deadline:
+                break
+            del self._runners[key]
+            self.stats.evicted_idle += 1
+
+    def report(self) -> dict[str, int]:
+        self.sweep()
+        return {
+            'live': len(self._runners),
+            'created': self.stats.created,
+            'reused': self.stats.reused,
+            'evicted_idle': self.stats.evicted_idle,
+            'evicted_lru': self.stats.evicted_lru,
+            'estimated_bytes': len(self._runners) * (self._runner_size or 0)
+        }
@@ -0,0 +1,153 @@
+import collections
+import datetime
+import math
+from typing import Any, Callable, Final, Hashable, Optional
+
+import discord
+
+from .owm.cache import quantize
+from .owm.models import DailySummary, Forecast, Weather
+from .owm.openweathermap import OWM
+
+DEFAULT_MAXSIZE: Final[int] = 256
+# Discord caps a select menu at 25 options.
+MAX_SELECT_OPTIONS: Final[int] = 25
+WEEKDAYS: Final[str] = '月火水木金土日'
+
+
+def _main_fields(weather: Weather) -> list[dict]:
+    return [
+        {'name': '気温', 'value': '{}°C'.format(weather.main.temperature), 'inline': True},
+        {'name': '最高気温', 'value': '{}°C'.format(weather.main.temperature_max), 'inline': True},
+        {'name': '最低気温', 'value': '{}°C'.format(weather.main.temperature_min), 'inline': True},
+        {'name': '湿度', 'value': '{}%'.format(weather.main.humidity), 'inline': True},
+        {'name': '気圧', 'value': '{}hPa'.format(weather.main.pressure), 'inline': True}
+    ]
+
+
+def weather_embed_dict(weather: Weather) -> dict:
+    return {
+        'title': '{}'.format(weather.city.name),
+        'description': '現在{0}時点でのお天気は{1}です。'.format(
+            weather.time.strftime('%H時%M分'), weather.conditions[0].description
+        ),
+        'thumbnail': {'url': weather.get_icon_url()},
+        'fields': _main_fields(weather=weather),
+        'footer': {'text': 'OpenWeatherを参照しています。', 'url': OWM.OPEN_WEATHER_ICON_URL}
+    }
+
+
+def forecast_embed_dict(weather: Weather) -> dict:
+    return {
+        'title': '{}'.format(weather.city.name),
+        'description': '{0}時点でのお天気は{1}と予測されています。'.format(
+            weather.time.strftime('%Y年%m月%d日%H時%M分'), weather.conditions[0].description
+        ),
+        'thumbnail': {'url': weather.get_icon_url()},
+        'fields': _main_fields(weather=weather),
+        'footer': {'text': 'OpenWeatherを参照しています。', 'url': OWM.OPEN_WEATHER_ICON_URL}
+    }
+
+
+def _measure(value: float, form: str) -> str:
+    return '-' if math.isnan(value) else form.format(value)
+
+
+def _daily_field(summary: DailySummary) -> dict:
+    return {
+        'name': '{0}月{1}日({2})'.format(summary.date.month, summary.date.day, WEEKDAYS[summary.date.weekday()]),
+        'value': '{0}\n最高 {1} / 最低 {2}\n降水確率 {3}\n雨 {4} / 雪 {5}'.format(
+            summary.condition.description if summary.condition is not None else '-',
+            _measure(summary.temperature_max, '{:.1f}°C'), _measure(summary.temperature_min, '{:.1f}°C'),
+            _measure(summary.probability_max * 100, '{:.0f}%'),
+            '{:.1f}mm'.format(summary.rain), '{:.1f}mm'.format(summary.snow)
+        ),
+        'inline': True
+    }
+
+
+def daily_embed_dict(forecast: Forecast) -> dict:
+    daily = forecast.get_daily()
+    embed_dict = {
+        'title': '{}'.format(forecast.weathers[0].city.name) if daily else '',
+        'description': '日ごとの予報です。' if daily else '予報を取得できませんでした。',
+        'fields': [_daily_field(summary=summary) for summary in daily],
+        'footer': {'text': 'OpenWeatherを参照しています。', 'url': OWM.OPEN_WEATHER_ICON_URL}
+    }
+    if daily and daily[0].condition is not None:
+        embed_dict['thumbnail'] = {'url': 'https://openweathermap.org/img/wn/{0}@4x.png'.format(
+            daily[0].condition.icon)}
+    return embed_dict
+
+
+def datetime_options(forecast: Forecast) -> list[discord.SelectOption]:
+    return [discord.SelectOption(label=time.strftime('%m月%d日%H時%M分'), value=time.isoformat())
+            for time in forecast.get_datetime_list()[:MAX_SELECT_OPTIONS]]
+
+
+class RenderStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations
+        }
+
+
+class EmbedRenderer:
+    # Rendered embeds and select options, shared by every Runner and notice. The results are shared too, so callers
+    # must copy before changing them (Windows already copies through dict.update).
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self.stats = RenderStats()
+        # (kind, quantized lat, lon) -> (data it was rendered from, {slot: rendered}); a new Forecast or Weather
+        # object for the location means the data was refetched, which drops everything rendered from the old one.
+        self._renders: collections.OrderedDict[Hashable, tuple[Any, dict[Hashable, Any]]] = \
+            collections.OrderedDict()
+
+    def __len__(self):
+        return sum(len(slots) for _, slots in self._renders.values())
+
+    def _render(self, kind: str, lat: float, lon: float, data: Any, slot: Hashable,
+                render: Callable[[], Any]) -> Any:
+        key = (kind,) + quantize(lat=lat, lon=lon)
+        entry = self._renders.get(key)
+        if entry is None or entry[0] is not data:
+            if entry is not None:
+                self.stats.invalidations += 1
+            entry = self._renders[key] = (data, {})
+            while len(self._renders) > self.maxsize:
+                self._renders.popitem(last=False)
+        self._renders.move_to_end(key)
+        slots = entry[1]
+        rendered = slots.get(slot)
+        if rendered is None:
+            self.stats.misses += 1
+            rendered = slots[slot] = render()
+        else:
+            self.stats.hits += 1
+        return rendered
+
+    def weather(self, lat: float, lon: float, weather: Weather) -> dict:
+        return self._render(kind='weather', lat=lat, lon=lon, data=weather, slot=None,
+                            render=lambda: weather_embed_dict(weather=weather))
+
+    def forecast(self, lat: float, lon: float, forecast: Forecast, time: datetime.datetime) -> Optional[dict]:
+        row = forecast.get_row_at(time)
+        if row is None:
+            return None
+        return self._render(kind='forecast', lat=lat, lon=lon, data=forecast, slot=row.index,
+                            render=lambda: forecast_embed_dict(weather=row.weather))
+
+    def daily(self, lat: float, lon: float, forecast: Forecast) -> dict:
+        return self._render(kind='forecast', lat=lat, lon=lon, data=forecast, slot='daily',
+                            render=lambda: daily_embed_dict(forecast=forecast))
+
+    def options(self, lat: float, lon: float, forecast: Forecast) -> list[discord.SelectOption]:
+        return self._render(kind='forecast', lat=lat, lon=lon, data=forecast, slot='options',
+                            render=lambda: datetime_options(forecast=forecast))
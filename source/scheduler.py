@@ -0,0 +1,235 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+from typing import Awaitable, Callable, Collection, Final, Optional
+
+from .owm.models import ZONE_TOKYO
+from .storage import Subscription
+
+DEFAULT_INTERVAL: Final[datetime.timedelta] = datetime.timedelta(days=1)
+# A notice may go out this much earlier than last + interval, so a daily notice does not slip by a day.
+NOTICE_TOLERANCE: Final[datetime.timedelta] = datetime.timedelta(minutes=1)
+ONE_DAY: Final[datetime.timedelta] = datetime.timedelta(days=1)
+# A notice that was not delivered is retried after a delay that doubles with how late it already is, within these
+# bounds, until it is RETRY_WINDOW late; after that it waits for its next regular slot.
+RETRY_MIN_DELAY: Final[datetime.timedelta] = datetime.timedelta(minutes=1)
+RETRY_MAX_DELAY: Final[datetime.timedelta] = datetime.timedelta(minutes=30)
+RETRY_WINDOW: Final[datetime.timedelta] = datetime.timedelta(hours=3)
+
+logger = logging.getLogger(__name__)
+
+
+def _aware(value: datetime.datetime) -> datetime.datetime:
+    # The weather table stores Tokyo wall-clock times without a zone.
+    return value if value.tzinfo is not None else value.replace(tzinfo=ZONE_TOKYO)
+
+
+def next_fire_at(subscription: Subscription, now: datetime.datetime) -> datetime.datetime:
+    earliest = now
+    if subscription.last is not None:
+        earliest = max(now, _aware(subscription.last) + (subscription.interval or DEFAULT_INTERVAL) - NOTICE_TOLERANCE)
+    fire_at = datetime.datetime.combine(earliest.date(), subscription.time, tzinfo=ZONE_TOKYO)
+    while fire_at < earliest:
+        fire_at += ONE_DAY
+    return fire_at
+
+
+def _slot(subscription: Subscription, at: datetime.datetime) -> datetime.datetime:
+    # The latest occurrence of the notice time at or before at.
+    at = at.astimezone(ZONE_TOKYO)
+    slot = datetime.datetime.combine(at.date(), subscription.time, tzinfo=ZONE_TOKYO)
+    return slot if slot <= at else slot - ONE_DAY
+
+
+def delivered(subscription: Subscription, now: datetime.datetime) -> Subscription:
+    # The subscription once its notice went out at now. 'last' is the slot the notice was for rather than now, so a
+    # late delivery (a retry, or a catch-up at start-up) does not push the next notice back a day.
+    last = _slot(subscription=subscription, at=now)
+    return subscription._replace(last=last,
+                                 next_fire_at=next_fire_at(subscription=subscription._replace(last=last), now=now))
+
+
+def retry_fire_at(subscription: Subscription, now: datetime.datetime) -> datetime.datetime:
+    # Lateness is measured from the slot rather than counted, so the backoff carries over across processes and
+    # restarts without storing an attempt number.
+    late = now - _slot(subscription=subscription, at=now)
+    # Looked up past the shortest delay, which skips the slot being retried.
+    regular = next_fire_at(subscription=subscription, now=now + RETRY_MIN_DELAY)
+    if late >= RETRY_WINDOW:
+        return regular
+    return min(now + min(max(late, RETRY_MIN_DELAY), RETRY_MAX_DELAY), regular)
+
+
+def on_schedule(subscription: Subscription) -> bool:
+    # Whether the stored next_fire_at still belongs to the row: at its notice time, or within reach of a retry.
+    # Anything else means the row was changed after next_fire_at was written.
+    fire_at = _aware(subscription.next_fire_at)
+    return fire_at - _slot(subscription=subscription, at=fire_at) <= RETRY_WINDOW + RETRY_MAX_DELAY
+
+
+class NoticeScheduler:
+    def __init__(self, on_due: Callable[[list[Subscription], datetime.datetime],
+                                        Awaitable[Optional[Collection[int]]]],
+                 clock: Callable[[], datetime.datetime] = lambda: datetime.datetime.now(tz=ZONE_TOKYO),
+                 poll_interval: Optional[float] = None):
+        # Returns the ids it could not deliver, which are retried; None means everything went out.
+        self.on_due = on_due
+        self.clock = clock
+        # When set, on_due also runs at least this often, possibly with nothing locally due, so a process sharing
+        # the table with others can claim rows it never loaded (added elsewhere, or left by a dead process).
+        self.poll_interval = poll_interval
+        # Heap of (fire_at, sequence, id); entries superseded by add/remove are skipped lazily when popped.
+        self._heap: list[tuple[datetime.datetime, int, int]] = []
+        self._entries: dict[int, tuple[int, Subscription]] = {}
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # The notice run in progress; stop() leaves it going so its sends are recorded.
+        self._in_flight: Optional[asyncio.Future] = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def next_fire_at(self) -> Optional[datetime.datetime]:
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def upcoming(self, until: datetime.datetime) -> list[Subscription]:
+        # Subscriptions firing by until, found by walking the heap from the top and skipping subtrees that start later.
+        found = []
+        stack = [0] if self._heap else []
+        while stack:
+            index = stack.pop()
+            if self._heap[index][0] > until:
+                continue
+            entry = self._entries.get(self._heap[index][2])
+            if entry is not None and entry[0] == self._heap[index][1]:
+                found.append(entry[1])
+            stack.extend(child for child in (2 * index + 1, 2 * index + 2) if child < len(self._heap))
+        return found
+
+    def _push(self, subscription: Subscription):
+        sequence = next(self._sequence)
+        key = subscription.id
+        self._entries[key] = (sequence, subscription)
+        heapq.heappush(self._heap, (subscription.next_fire_at, sequence, key))
+        self._compact()
+        if self._heap[0][1] == sequence:
+            self._wakeup.set()
+
+    def add(self, subscription: Subscription, now: Optional[datetime.datetime] = None):
+        fire_at = next_fire_at(subscription=subscription, now=self.clock() if now is None else now)
+        self._push(subscription=subscription._replace(next_fire_at=fire_at))
+
+    def retry(self, subscription: Subscription, now: Optional[datetime.datetime] = None):
+        fire_at = retry_fire_at(subscription=subscription, now=self.clock() if now is None else now)
+        self._push(subscription=subscription._replace(next_fire_at=fire_at))
+
+    def update(self, subscription: Subscription):
+        self.add(subscription=subscription)
+
+    def remove(self, subscription: Subscription):
+        self._entries.pop(subscription.id, None)
+        self._compact()
+
+    def load(self, subscriptions: list[Subscription]) \
+            -> list[tuple[int, Optional[datetime.datetime], datetime.datetime]]:
+        now = self.clock()
+        # A stored next_fire_at is kept even when it has passed, so a notice that was due but not yet sent when the
+        # process stopped goes out now instead of tomorrow. Only rows without one, or changed since it was written,
+        # are scheduled afresh and returned as updates for Storage.backfill_many.
+        updates = []
+        for subscription in subscriptions:
+            if subscription.next_fire_at is None or not on_schedule(subscription=subscription):
+                fire_at = next_fire_at(subscription=subscription, now=now)
+                updates.append((subscription.id, subscription.next_fire_at, fire_at))
+                subscription = subscription._replace(next_fire_at=fire_at)
+            self._entries[subscription.id] = (next(self._sequence), subscription)
+        self._heap = [(subscription.next_fire_at, sequence, key)
+                      for key, (sequence, subscription) in self._entries.items()]
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+        return updates
+
+    def _is_stale(self, item: tuple[datetime.datetime, int, int]) -> bool:
+        entry = self._entries.get(item[2])
+        return entry is None or entry[0] != item[1]
+
+    def _discard_stale(self):
+        while self._heap and self._is_stale(self._heap[0]):
+            heapq.heappop(self._heap)
+
+    def _compact(self):
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [item for item in self._heap if not self._is_stale(item)]
+            heapq.heapify(self._heap)
+
+    def _pop_due(self, now: datetime.datetime) -> list[Subscription]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, sequence, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == sequence:
+                due.append(entry[1])
+        return due
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def drain(self):
+        # Waits for the run stop() left going, so its sends are written back before the caller lets go of storage
+        # or of its leases.
+        if self._in_flight is not None:
+            in_flight, self._in_flight = self._in_flight, None
+            try:
+                await in_flight
+            except Exception:
+                logger.exception('notice run failed while stopping')
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            fire_at = self.next_fire_at()
+            delay = None if fire_at is None else (fire_at - self.clock()).total_seconds()
+            if self.poll_interval is not None and (delay is None or delay > self.poll_interval):
+                delay = self.poll_interval
+            if delay is None:
+                await self._wakeup.wait()
+                continue
+            if delay > 0:
+                try:
+                    # Woken early when a subscription that fires sooner is added.
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+            now = self.clock()
+            due = self._pop_due(now=now)
+            if not due and self.poll_interval is None:
+                continue
+            undelivered = None
+            self._in_flight = asyncio.ensure_future(self.on_due(due, now))
+            try:
+                # Shielded so that stopping does not cut a run off between its sends and the write recording them.
+                undelivered = await asyncio.shield(self._in_flight)
+            except Exception:
+                # Only the final write can fail after sends went out, so the run is not repeated.
+                logger.exception('notice run for %d subscriptions failed', len(due))
+            self._in_flight = None
+            for subscription in due:
+                entry = self._entries.get(subscription.id)
+                if entry is None or entry[1] is not subscription:
+                    # Removed or replaced while the notices were going out.
+                    continue
+                if undelivered is not None and subscription.id in undelivered:
+                    self.retry(subscription=subscription, now=now)
+                else:
+                    self._push(subscription=delivered(subscription=subscription, now=now))
@@ -0,0 +1,54 @@
+import logging
+from typing import Final, NamedTuple
+
+import psycopg2.extensions
+
+# Any constant works as long as every process migrating the same database uses it.
+MIGRATION_LOCK_ID: Final[int] = 0x5745415448455200
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    statements: tuple[str, ...]
+
+
+MIGRATIONS: Final[tuple[Migration, ...]] = (
+    Migration(version=1, description='create weather table', statements=(
+        'CREATE TABLE IF NOT EXISTS weather (channel_id BIGINT, time TIME, interval INTERVAL, last TIMESTAMP, is_forecast BOOLEAN, lat REAL, lon REAL)',
+    )),
+    Migration(version=2, description='add surrogate key, next_fire_at and indexes', statements=(
+        'ALTER TABLE weather ADD COLUMN IF NOT EXISTS id BIGSERIAL PRIMARY KEY',
+        'ALTER TABLE weather ADD COLUMN IF NOT EXISTS next_fire_at TIMESTAMPTZ',
+        'CREATE INDEX IF NOT EXISTS weather_channel_id_idx ON weather (channel_id)',
+        'CREATE INDEX IF NOT EXISTS weather_next_fire_at_idx ON weather (next_fire_at)'
+    )),
+    Migration(version=3, description='add notice leases for multi-process dispatch', statements=(
+        'ALTER TABLE weather ADD COLUMN IF NOT EXISTS lease_owner TEXT',
+        'ALTER TABLE weather ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ'
+    ))
+)
+
+
+def migrate(connection: psycopg2.extensions.connection) -> list[int]:
+    applied = []
+    with connection.cursor() as cur:
+        # Serializes processes that start at the same time; released when the transaction ends.
+        cur.execute('SELECT pg_advisory_xact_lock(%s)', (MIGRATION_LOCK_ID,))
+        cur.execute(
+            'CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY, description TEXT, applied_at TIMESTAMPTZ NOT NULL DEFAULT now())'
+        )
+        cur.execute('SELECT version FROM schema_migrations')
+        versions = {row[0] for row in cur.fetchall()}
+        for migration in MIGRATIONS:
+            if migration.version in versions:
+                continue
+            for statement in migration.statements:
+                cur.execute(statement)
+            cur.execute('INSERT INTO schema_migrations (version, description) VALUES (%s, %s)',
+                        (migration.version, migration.description))
+            logger.info('applied migration %d: %s', migration.version, migration.description)
+            applied.append(migration.version)
+    return applied
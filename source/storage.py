@@ -0,0 +1,261 @@
+import asyncio
+import concurrent.futures
+import datetime
+import functools
+import os
+import time
+from typing import Any, Callable, Final, NamedTuple, Optional
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
+
+from .metrics import METRICS
+from .owm.models import ZONE_TOKYO
+from .schema import migrate
+
+DATABASE_URL: Final[str] = os.getenv('DATABASE_URL')
+HEALTH_CHECK_INTERVAL: Final[float] = 30.0
+RECONNECT_ATTEMPTS: Final[int] = 2
+
+SUBSCRIPTION_COLUMNS: Final[str] = 'id, channel_id, time, interval, last, is_forecast, lat, lon, next_fire_at'
+# name: (parameter types, statement)
+STATEMENTS: Final[dict[str, tuple[tuple[str, ...], str]]] = {
+    'select_subscriptions': (
+        (), 'SELECT {} FROM weather'.format(SUBSCRIPTION_COLUMNS)
+    ),
+    'select_due_subscriptions': (
+        ('TIMESTAMPTZ',),
+        'SELECT {} FROM weather WHERE next_fire_at <= $1 ORDER BY next_fire_at'.format(SUBSCRIPTION_COLUMNS)
+    ),
+    'insert_subscription': (
+        ('BIGINT', 'TIME', 'INTERVAL', 'BOOLEAN', 'REAL', 'REAL', 'TIMESTAMPTZ'),
+        'INSERT INTO weather (channel_id, time, interval, is_forecast, lat, lon, next_fire_at) '
+        'VALUES ($1, $2, $3, $4, $5, $6, $7) RETURNING id'
+    ),
+    'delete_subscription': (
+        ('BIGINT',), 'DELETE FROM weather WHERE id = $1'
+    ),
+    # Leases are timed on the database clock so processes on hosts with skewed clocks still agree. Rows outside the
+    # claimer's partition (dispatch.partition_of, computed here on the same grid) are only taken once $7 late.
+    'claim_due_subscriptions': (
+        ('TEXT', 'TIMESTAMPTZ', 'INTERVAL', 'INTEGER', 'INTEGER', 'INTEGER', 'INTERVAL'),
+        'UPDATE weather SET lease_owner = $1, lease_expires_at = now() + $3 WHERE id IN ('
+        'SELECT id FROM weather WHERE next_fire_at <= $2 AND (lease_expires_at IS NULL OR lease_expires_at <= now()) '
+        'AND (((round(lat::NUMERIC, 2) * 100 + 9000) * 36001 + round(lon::NUMERIC, 2) * 100 + 18000)::BIGINT % $5 = $6 '
+        'OR next_fire_at <= $2 - $7) '
+        'ORDER BY next_fire_at LIMIT $4 FOR UPDATE SKIP LOCKED) RETURNING {}'.format(SUBSCRIPTION_COLUMNS)
+    ),
+    'renew_leases': (
+        ('TEXT', 'INTERVAL', 'BIGINT[]'),
+        'UPDATE weather SET lease_expires_at = now() + $2 WHERE lease_owner = $1 AND id = ANY($3)'
+    ),
+    'release_leases': (
+        ('TEXT',), 'UPDATE weather SET lease_owner = NULL, lease_expires_at = NULL WHERE lease_owner = $1'
+    )
+}
+
+
+def _wall_clock(value: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    # 'last' is a TIMESTAMP holding Tokyo wall-clock time.
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(ZONE_TOKYO).replace(tzinfo=None)
+
+
+class Subscription(NamedTuple):
+    id: int
+    channel_id: int
+    time: datetime.time
+    interval: Optional[datetime.timedelta]
+    last: Optional[datetime.datetime]
+    is_forecast: bool
+    lat: float
+    lon: float
+    next_fire_at: Optional[datetime.datetime] = None
+
+
+class _Connection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: set[str] = set()
+        self.last_used = time.monotonic()
+
+
+class Storage:
+    def __init__(self, dsn: str = DATABASE_URL, min_connections: int = 1, max_connections: int = 5):
+        self.dsn = dsn
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_connections,
+                                                              thread_name_prefix='weather-storage')
+        self._pool: Optional[psycopg2.pool.ThreadedConnectionPool] = None
+
+    async def _run(self, function: Callable[..., Any], *args, **kwargs) -> Any:
+        # psycopg2 blocks, so every call is pushed off the event loop onto the storage threads.
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, functools.partial(function, *args, **kwargs))
+
+    async def connect(self):
+        if self._pool is None:
+            self._pool = await self._run(
+                psycopg2.pool.ThreadedConnectionPool, self.min_connections, self.max_connections,
+                dsn=self.dsn, connection_factory=_Connection)
+        await self._run(self._transaction, migrate)
+
+    async def close(self):
+        if self._pool is not None:
+            await self._run(self._pool.closeall)
+            self._pool = None
+        self.executor.shutdown(wait=False)
+
+    def _checkout(self) -> _Connection:
+        connection: _Connection = self._pool.getconn()
+        if not connection.closed and time.monotonic() - connection.last_used < HEALTH_CHECK_INTERVAL:
+            return connection
+        try:
+            if connection.closed:
+                raise psycopg2.InterfaceError('connection already closed')
+            with connection.cursor() as cur:
+                cur.execute('SELECT 1')
+            connection.rollback()
+            return connection
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self._pool.putconn(connection, close=True)
+            return self._pool.getconn()
+
+    def _abandon(self, connection: _Connection):
+        if not connection.closed:
+            connection.rollback()
+        self._pool.putconn(connection, close=bool(connection.closed))
+
+    def _transaction(self, function: Callable[..., Any], *args) -> Any:
+        for attempt in range(RECONNECT_ATTEMPTS):
+            connection = self._checkout()
+            try:
+                result = function(connection, *args)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self._abandon(connection)
+                # Only a connection that died before the commit is retried, as nothing of the work can have stuck.
+                # Anything else, a statement timeout for one, is the caller's to see.
+                if not connection.closed or attempt + 1 == RECONNECT_ATTEMPTS:
+                    raise
+                continue
+            except BaseException:
+                self._abandon(connection)
+                raise
+            try:
+                connection.commit()
+            except BaseException:
+                # Never retried: the server may have committed before the error reached us, and running the work
+                # again could insert a row twice.
+                self._abandon(connection)
+                raise
+            connection.last_used = time.monotonic()
+            self._pool.putconn(connection)
+            return result
+
+    @staticmethod
+    def _execute(connection: _Connection, name: str, params: tuple = ()) -> Optional[list[tuple]]:
+        with connection.cursor() as cur:
+            if name not in connection.prepared:
+                types, statement = STATEMENTS[name]
+                cur.execute('PREPARE {0} {1} AS {2}'.format(
+                    name, '({})'.format(', '.join(types)) if types else '', statement))
+                connection.prepared.add(name)
+            if params:
+                cur.execute('EXECUTE {0} ({1})'.format(name, ', '.join(['%s'] * len(params))), params)
+            else:
+                cur.execute('EXECUTE {}'.format(name))
+            return cur.fetchall() if cur.description is not None else None
+
+    @staticmethod
+    def _update_many(connection: _Connection, updates: list[tuple[int, Optional[datetime.datetime], datetime.datetime]]):
+        with connection.cursor() as cur:
+            psycopg2.extras.execute_values(
+                cur,
+                'UPDATE weather SET last = COALESCE(v.last, weather.last), next_fire_at = v.next_fire_at '
+                'FROM (VALUES %s) AS v (id, last, next_fire_at) WHERE weather.id = v.id',
+                updates, template='(%s::BIGINT, %s::TIMESTAMP, %s::TIMESTAMPTZ)', page_size=1000
+            )
+
+    @staticmethod
+    def _backfill_many(connection: _Connection,
+                       updates: list[tuple[int, Optional[datetime.datetime], datetime.datetime]]):
+        with connection.cursor() as cur:
+            # Only where the row still holds the next_fire_at it was read with and no live lease covers it, so a
+            # process starting up never moves a row that another process has since sent, rescheduled or leased.
+            psycopg2.extras.execute_values(
+                cur,
+                'UPDATE weather SET next_fire_at = v.next_fire_at '
+                'FROM (VALUES %s) AS v (id, previous, next_fire_at) '
+                'WHERE weather.id = v.id AND weather.next_fire_at IS NOT DISTINCT FROM v.previous '
+                'AND (weather.lease_expires_at IS NULL OR weather.lease_expires_at <= now())',
+                updates, template='(%s::BIGINT, %s::TIMESTAMPTZ, %s::TIMESTAMPTZ)', page_size=1000
+            )
+
+    @staticmethod
+    def _complete_many(connection: _Connection,
+                       updates: list[tuple[int, Optional[datetime.datetime], datetime.datetime, str]]):
+        with connection.cursor() as cur:
+            # Rows whose lease expired and went to another process are left to that process.
+            psycopg2.extras.execute_values(
+                cur,
+                'UPDATE weather SET last = COALESCE(v.last, weather.last), next_fire_at = v.next_fire_at, '
+                'lease_owner = NULL, lease_expires_at = NULL '
+                'FROM (VALUES %s) AS v (id, last, next_fire_at, owner) '
+                'WHERE weather.id = v.id AND weather.lease_owner = v.owner',
+                updates, template='(%s::BIGINT, %s::TIMESTAMP, %s::TIMESTAMPTZ, %s::TEXT)', page_size=1000
+            )
+
+    async def execute(self, name: str, params: tuple = ()) -> Optional[list[tuple]]:
+        with METRICS.timer('db_query', statement=name):
+            return await self._run(self._transaction, self._execute, name, params)
+
+    async def fetch_subscriptions(self) -> list[Subscription]:
+        return [Subscription._make(row) for row in await self.execute(name='select_subscriptions')]
+
+    async def fetch_due_subscriptions(self, now: datetime.datetime) -> list[Subscription]:
+        return [Subscription._make(row) for row in await self.execute(name='select_due_subscriptions', params=(now,))]
+
+    async def add_subscription(self, channel_id: int, time: datetime.time, interval: datetime.timedelta,
+                               is_forecast: bool, lat: float, lon: float, next_fire_at: datetime.datetime) -> int:
+        rows = await self.execute(name='insert_subscription',
+                                  params=(channel_id, time, interval, is_forecast, lat, lon, next_fire_at))
+        return rows[0][0]
+
+    async def remove_subscription(self, id: int):
+        await self.execute(name='delete_subscription', params=(id,))
+
+    async def update_many(self, updates: list[tuple[int, Optional[datetime.datetime], datetime.datetime]]):
+        # (id, last, next_fire_at) per row; a None last keeps the stored one.
+        with METRICS.timer('db_query', statement='update_many'):
+            await self._run(self._transaction, self._update_many,
+                            [(id, _wall_clock(last), fire_at) for id, last, fire_at in updates])
+
+    async def backfill_many(self, updates: list[tuple[int, Optional[datetime.datetime], datetime.datetime]]):
+        # (id, next_fire_at as read, new next_fire_at) per row, from NoticeScheduler.load.
+        with METRICS.timer('db_query', statement='backfill_many'):
+            await self._run(self._transaction, self._backfill_many, updates)
+
+    async def claim_due_subscriptions(self, owner: str, now: datetime.datetime, lease: datetime.timedelta,
+                                      limit: int, partitions: int = 1, partition: int = 0,
+                                      takeover: datetime.timedelta = datetime.timedelta()) -> list[Subscription]:
+        # Leases up to limit due rows that no live process holds; SKIP LOCKED keeps concurrent claims disjoint.
+        return [Subscription._make(row) for row in await self.execute(
+            name='claim_due_subscriptions', params=(owner, now, lease, limit, partitions, partition, takeover))]
+
+    async def renew_leases(self, owner: str, lease: datetime.timedelta, ids: list[int]):
+        # Rows whose lease already went to another process stay with it.
+        await self.execute(name='renew_leases', params=(owner, lease, ids))
+
+    async def complete_many(self, owner: str,
+                            updates: list[tuple[int, Optional[datetime.datetime], datetime.datetime]]):
+        # update_many for leased rows, also giving the leases back.
+        with METRICS.timer('db_query', statement='complete_many'):
+            await self._run(self._transaction, self._complete_many,
+                            [(id, _wall_clock(last), fire_at, owner) for id, last, fire_at in updates])
+
+    async def release_leases(self, owner: str):
+        await self.execute(name='release_leases', params=(owner,))
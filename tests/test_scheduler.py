@@ -0,0 +1,160 @@
+import asyncio
+import datetime
+import unittest
+
+from source.owm.models import ZONE_TOKYO
+from source.scheduler import (NoticeScheduler, RETRY_MAX_DELAY, RETRY_MIN_DELAY, RETRY_WINDOW, delivered,
+                              next_fire_at, on_schedule, retry_fire_at)
+from source.storage import Subscription
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def _at(day: int, hour: int, minute: int = 0) -> datetime.datetime:
+    return datetime.datetime(2026, 10, day, hour, minute, tzinfo=ZONE_TOKYO)
+
+
+def _subscription(id: int = 1, time: datetime.time = datetime.time(0, 5), last: datetime.datetime = None,
+                  next_fire_at: datetime.datetime = None) -> Subscription:
+    return Subscription(id=id, channel_id=id, time=time, interval=ONE_DAY, last=last, is_forecast=False,
+                        lat=35.689, lon=139.692, next_fire_at=next_fire_at)
+
+
+class NextFireAtTest(unittest.TestCase):
+    def test_never_sent(self):
+        self.assertEqual(next_fire_at(_subscription(), now=_at(17, 0, 1)), _at(17, 0, 5))
+        self.assertEqual(next_fire_at(_subscription(), now=_at(17, 0, 5)), _at(17, 0, 5))
+        self.assertEqual(next_fire_at(_subscription(), now=_at(17, 0, 6)), _at(18, 0, 5))
+
+    def test_waits_for_the_interval(self):
+        self.assertEqual(next_fire_at(_subscription(last=_at(17, 0, 5)), now=_at(17, 0, 5)), _at(18, 0, 5))
+
+    def test_a_slightly_early_last_does_not_skip_a_day(self):
+        # Within NOTICE_TOLERANCE of the interval.
+        self.assertEqual(next_fire_at(_subscription(last=_at(17, 0, 5) + datetime.timedelta(seconds=30)),
+                                      now=_at(17, 0, 6)), _at(18, 0, 5))
+
+
+class DeliveredTest(unittest.TestCase):
+    def test_late_deliveries_keep_the_next_day(self):
+        for now in (_at(17, 0, 5), _at(17, 0, 25), _at(17, 3, 5), _at(17, 23, 59)):
+            with self.subTest(now=now):
+                done = delivered(_subscription(), now=now)
+                self.assertEqual(done.last, _at(17, 0, 5))
+                self.assertEqual(done.next_fire_at, _at(18, 0, 5))
+
+    def test_across_midnight(self):
+        done = delivered(_subscription(time=datetime.time(23, 50)), now=_at(18, 0, 30))
+        self.assertEqual(done.last, _at(17, 23, 50))
+        self.assertEqual(done.next_fire_at, _at(18, 23, 50))
+
+
+class RetryFireAtTest(unittest.TestCase):
+    def test_backoff_doubles_with_lateness(self):
+        subscription = _subscription()
+        now = _at(17, 0, 5)
+        delays = []
+        while now - _at(17, 0, 5) < RETRY_WINDOW:
+            fire_at = retry_fire_at(subscription, now=now)
+            delays.append(fire_at - now)
+            now = fire_at
+        self.assertEqual(delays[:6], [datetime.timedelta(minutes=minutes) for minutes in (1, 1, 2, 4, 8, 16)])
+        self.assertTrue(all(RETRY_MIN_DELAY <= delay <= RETRY_MAX_DELAY for delay in delays))
+
+    def test_gives_up_after_the_window(self):
+        self.assertEqual(retry_fire_at(_subscription(), now=_at(17, 0, 5) + RETRY_WINDOW), _at(18, 0, 5))
+
+    def test_never_repeats_the_slot(self):
+        self.assertGreater(retry_fire_at(_subscription(), now=_at(17, 0, 5)), _at(17, 0, 5))
+
+    def test_does_not_pass_the_next_slot(self):
+        subscription = _subscription(time=datetime.time(0, 5))
+        self.assertLessEqual(retry_fire_at(subscription, now=_at(18, 0, 4)), _at(18, 0, 5))
+
+
+class OnScheduleTest(unittest.TestCase):
+    def test_at_the_notice_time(self):
+        self.assertTrue(on_schedule(_subscription(next_fire_at=_at(17, 0, 5))))
+
+    def test_within_a_retry(self):
+        self.assertTrue(on_schedule(_subscription(next_fire_at=_at(17, 2, 5))))
+
+    def test_changed_notice_time(self):
+        self.assertFalse(on_schedule(_subscription(time=datetime.time(12, 0), next_fire_at=_at(17, 0, 5))))
+
+
+class LoadTest(unittest.IsolatedAsyncioTestCase):
+    async def test_keeps_stored_times_and_backfills_the_rest(self):
+        now = _at(17, 9, 0)
+        scheduler = NoticeScheduler(on_due=None, clock=lambda: now)
+        due = _subscription(id=1, next_fire_at=_at(17, 0, 5))
+        retrying = _subscription(id=2, next_fire_at=_at(17, 9, 30), time=datetime.time(9, 0))
+        missing = _subscription(id=3)
+        changed = _subscription(id=4, time=datetime.time(12, 0), next_fire_at=_at(17, 0, 5))
+        updates = scheduler.load([due, retrying, missing, changed])
+        self.assertEqual(updates, [(3, None, _at(18, 0, 5)), (4, _at(17, 0, 5), _at(17, 12, 0))])
+        self.assertEqual(scheduler.next_fire_at(), _at(17, 0, 5))
+        self.assertEqual(len(scheduler), 4)
+
+
+class RunTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.now = _at(17, 0, 5)
+        self.runs: list[tuple[list[int], datetime.datetime]] = []
+        self.undelivered: set[int] = set()
+        self.ran = asyncio.Event()
+        self.scheduler = NoticeScheduler(on_due=self.on_due, clock=lambda: self.now)
+
+    async def asyncTearDown(self):
+        self.scheduler.stop()
+        await self.scheduler.drain()
+
+    async def on_due(self, due: list[Subscription], now: datetime.datetime):
+        self.runs.append(([subscription.id for subscription in due], now))
+        self.ran.set()
+        return self.undelivered & {subscription.id for subscription in due}
+
+    async def _run_once(self):
+        self.ran.clear()
+        self.scheduler.start()
+        await asyncio.wait_for(self.ran.wait(), timeout=1.0)
+        # Lets _run reschedule what on_due returned.
+        await asyncio.sleep(0)
+
+    async def test_delivered_notices_move_to_the_next_day(self):
+        # Caught up 20 minutes late, as at start-up after a restart.
+        self.now = _at(17, 0, 25)
+        self.scheduler.load([_subscription(id=1, next_fire_at=_at(17, 0, 5))])
+        await self._run_once()
+        self.assertEqual(self.runs, [([1], _at(17, 0, 25))])
+        self.assertEqual(self.scheduler.next_fire_at(), _at(18, 0, 5))
+
+    async def test_undelivered_notices_are_retried(self):
+        self.undelivered = {1}
+        self.scheduler.load([_subscription(id=1, next_fire_at=_at(17, 0, 5)),
+                             _subscription(id=2, next_fire_at=_at(17, 0, 5))])
+        await self._run_once()
+        self.assertEqual(self.runs, [([1, 2], _at(17, 0, 5))])
+        self.assertEqual(self.scheduler.next_fire_at(), _at(17, 0, 6))
+        self.assertEqual([subscription.id for subscription in self.scheduler.upcoming(until=_at(17, 0, 6))], [1])
+
+    async def test_stop_lets_a_run_finish(self):
+        release = asyncio.Event()
+        finished = []
+
+        async def on_due(due: list[Subscription], now: datetime.datetime):
+            self.ran.set()
+            await release.wait()
+            finished.append([subscription.id for subscription in due])
+
+        self.scheduler.on_due = on_due
+        self.scheduler.load([_subscription(id=1, next_fire_at=_at(17, 0, 5))])
+        await self._run_once()
+        self.scheduler.stop()
+        release.set()
+        await self.scheduler.drain()
+        self.assertEqual(finished, [[1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,17 +3,26 @@ from discord.ext import commands
 import os
 from typing import final
 
-DISCORD_BOT_TOKEN: final(str) = os.getenv('DISCORD_BOT_TOKEN')
-bot = commands.Bot(command_prefix='/', intents=discord.Intents.all())
+from source.metrics import METRICS
 
+DISCORD_BOT_TOKEN: final(str) = os.getenv('DISCORD_BOT_TOKEN')
+# Sharded deployments run one process per group of shards: DISCORD_SHARD_COUNT in total, DISCORD_SHARD_IDS
+# (comma separated) in this process. Set WEATHER_SHARDED too, so notices are leased instead of sent by everyone.
+DISCORD_SHARD_COUNT: final(str) = os.getenv('DISCORD_SHARD_COUNT')
+DISCORD_SHARD_IDS: final(str) = os.getenv('DISCORD_SHARD_IDS')
 
-async def load_extensions():
-    await bot.load_extension('source.main', package='.')
 
+class WeatherBot(commands.AutoShardedBot if DISCORD_SHARD_COUNT else commands.Bot):
+    async def setup_hook(self):
+        # Runs once after login; on_ready fires again on every reconnect.
+        await self.load_extension('source.main', package='.')
+        METRICS.mark('extension_loaded')
 
-@bot.event
-async def on_ready():
-    await load_extensions()
 
+shards = {}
+if DISCORD_SHARD_COUNT:
+    shards = {'shard_count': int(DISCORD_SHARD_COUNT),
+              'shard_ids': [int(id) for id in DISCORD_SHARD_IDS.split(',')] if DISCORD_SHARD_IDS else None}
+bot = WeatherBot(command_prefix='/', intents=discord.Intents.all(), **shards)
 
 bot.run(DISCORD_BOT_TOKEN)